@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+
+import cv2
+from django.conf import settings
+
+from .metrics import metrics
+
+# ---------------------- CAMERA SETTINGS ----------------------
+# Device index (0 = first webcam) or a path to a video file, which is played in a
+# loop at its own frame rate and stands in for a camera (handy for testing).
+CAMERA_SOURCE = getattr(settings, "CIVICX_CAMERA_SOURCE", 0)
+# Keep the device open this long after the last consumer/snapshot so repeated
+# capture-now calls are served from memory instead of reopening the camera
+CAMERA_IDLE_RELEASE_S = getattr(settings, "CIVICX_CAMERA_IDLE_RELEASE_S", 30.0)
+# A snapshot older than this waits for the next frame instead
+CAMERA_MAX_FRAME_AGE_S = getattr(settings, "CIVICX_CAMERA_MAX_FRAME_AGE_S", 1.0)
+CAMERA_READ_FAILURES = 30
+
+
+class CameraUnavailable(Exception):
+    pass
+
+
+def _normalize_source(source):
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source)
+    return source
+
+
+class CameraSource:
+    """One opened device plus a reader thread that keeps ``latest`` fresh.
+
+    ``latest`` is a ``(frame, seq, timestamp)`` tuple replaced wholesale for every
+    frame, so readers take it without locking. Frames are shared between
+    consumers and marked read-only; copy before drawing on one.
+    """
+
+    def __init__(self, source, idle_release_s=CAMERA_IDLE_RELEASE_S):
+        self.source = source
+        self.is_file = isinstance(source, str)
+        self.idle_release_s = float(idle_release_s)
+        self.latest = None
+        self.consumers = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(threading.Lock())
+        # Set while a reader is shutting down; its capture is released once this is cleared
+        self.stopping = False
+        self.stopped = threading.Condition(self.lock)
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and not self.stopping
+
+    def _start_locked(self):
+        # Opening a second VideoCapture before the old one is released fails on most devices
+        while self.stopping:
+            self.stopped.wait()
+        if self.thread is not None:
+            return
+        if self.is_file and not os.path.exists(self.source):
+            raise CameraUnavailable(f"Camera source file not found: {self.source}")
+        start = time.perf_counter()
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            try:
+                cap.release()
+            except Exception:
+                pass
+            raise CameraUnavailable("Could not access camera (maybe it's in use)")
+        metrics.incr("camera_opens")
+        metrics.observe("camera_open", time.perf_counter() - start)
+        self.latest = None
+        self.thread = threading.Thread(target=self._reader, args=(cap,), daemon=True)
+        self.thread.start()
+
+    def _idle_locked(self):
+        return self.consumers == 0 and time.monotonic() - self.last_used > self.idle_release_s
+
+    def _reader(self, cap):
+        fps = cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        interval = 1.0 / fps if fps and fps > 0 else (1.0 / 30 if self.is_file else 0)
+        seq, failures = 0, 0
+        next_due = time.monotonic()
+        try:
+            while True:
+                with self.lock:
+                    if self._idle_locked():
+                        self.stopping = True
+                        break
+                ok, frame = cap.read()
+                if not ok or frame is None:
+                    if self.is_file and cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                        continue
+                    failures += 1
+                    if failures >= CAMERA_READ_FAILURES:
+                        print(f"camera {self.source!r}: no frames, releasing device")
+                        with self.lock:
+                            self.stopping = True
+                        break
+                    time.sleep(0.05)
+                    continue
+                failures = 0
+                seq += 1
+                frame.flags.writeable = False
+                self.latest = (frame, seq, time.monotonic())
+                with self.new_frame:
+                    self.new_frame.notify_all()
+                if interval:
+                    # Video files would decode as fast as possible; pace them like a camera
+                    next_due += interval
+                    delay = next_due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_due = time.monotonic()
+        except Exception as e:
+            print(f"camera {self.source!r} reader error:", e)
+        finally:
+            with self.lock:
+                self.stopping = True
+            try:
+                cap.release()
+            except Exception:
+                pass
+            with self.lock:
+                self.thread = None
+                self.stopping = False
+                self.latest = None
+                self.stopped.notify_all()
+            with self.new_frame:
+                self.new_frame.notify_all()
+            print(f"camera {self.source!r} released")
+
+    # ---------------------- consumers ----------------------
+    def acquire(self):
+        """Register a long-lived consumer (opens the device if needed)."""
+        with self.lock:
+            self._start_locked()
+            self.consumers += 1
+            self.last_used = time.monotonic()
+        return self
+
+    def release(self):
+        with self.lock:
+            self.consumers = max(0, self.consumers - 1)
+            self.last_used = time.monotonic()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def wait_frame(self, after_seq=0, timeout=2.0):
+        """Block until a frame newer than ``after_seq`` exists; returns (frame, seq) or None."""
+        deadline = time.monotonic() + timeout
+        with self.new_frame:
+            while True:
+                latest = self.latest
+                if latest is not None and latest[1] > after_seq:
+                    return latest[0], latest[1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.running:
+                    return None
+                self.new_frame.wait(remaining)
+
+    def snapshot(self, max_age=CAMERA_MAX_FRAME_AGE_S, timeout=5.0):
+        """Most recent frame, opening the device first if nobody is using it."""
+        with self.lock:
+            self._start_locked()
+            self.last_used = time.monotonic()
+        latest = self.latest
+        if latest is not None and time.monotonic() - latest[2] <= max_age:
+            metrics.incr("camera_snapshots", "memory")
+            return latest[0]
+        metrics.incr("camera_snapshots", "waited")
+        got = self.wait_frame(latest[1] if latest else 0, timeout)
+        return got[0] if got else None
+
+    def describe(self):
+        latest = self.latest
+        return {
+            "source": self.source,
+            "running": self.running,
+            "consumers": self.consumers,
+            "frame_age_s": round(time.monotonic() - latest[2], 3) if latest else None,
+        }
+
+
+class CameraBroker:
+    """Hands out one shared CameraSource per device."""
+
+    def __init__(self, default_source=CAMERA_SOURCE, idle_release_s=CAMERA_IDLE_RELEASE_S):
+        self.default_source = _normalize_source(default_source)
+        self.idle_release_s = idle_release_s
+        self.sources = {}
+        self.lock = threading.Lock()
+
+    def get(self, source=None):
+        source = self.default_source if source is None else _normalize_source(source)
+        with self.lock:
+            cam = self.sources.get(source)
+            if cam is None:
+                cam = CameraSource(source, self.idle_release_s)
+                self.sources[source] = cam
+            return cam
+
+    def status(self):
+        with self.lock:
+            return [cam.describe() for cam in self.sources.values()]
+
+
+camera_broker = CameraBroker()
@@ -0,0 +1,140 @@
+import random
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .metrics import metrics
+
+# Escalate to the large model when the small model's top-1 confidence is below
+# CASCADE_MIN_CONFIDENCE or its lead over the runner-up is below CASCADE_MIN_MARGIN.
+CASCADE_MIN_CONFIDENCE = getattr(settings, "CIVICX_CASCADE_MIN_CONFIDENCE", 0.80)
+CASCADE_MIN_MARGIN = getattr(settings, "CIVICX_CASCADE_MIN_MARGIN", 0.30)
+# Fraction of confident small-model answers that are also run through the large
+# model to estimate how often the cascade disagrees with it.
+CASCADE_AUDIT_RATE = getattr(settings, "CIVICX_CASCADE_AUDIT_RATE", 0.02)
+
+
+def extract_probs(result):
+    """Class probability vector from an ultralytics classification result."""
+    probs = getattr(result, 'probs', None)
+    if probs is None:
+        return None
+    data = getattr(probs, 'data', probs)
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    return np.asarray(data, dtype=np.float32).ravel()
+
+
+def _top2(probs):
+    if probs.size == 1:
+        return 0, float(probs[0]), 0.0
+    top2 = np.argpartition(probs, -2)[-2:]
+    first, second = (top2[1], top2[0]) if probs[top2[1]] >= probs[top2[0]] else (top2[0], top2[1])
+    return int(first), float(probs[first]), float(probs[second])
+
+
+def _run_batch(model, images, stage):
+    start = time.perf_counter()
+    results = model(images if len(images) > 1 else images[0], verbose=False)
+    elapsed = time.perf_counter() - start
+    metrics.observe(f"inference_{stage}" if len(images) == 1 else f"inference_{stage}_batch", elapsed)
+    preds = []
+    for res in results:
+        probs = extract_probs(res)
+        if probs is None or probs.size == 0:
+            preds.append(None)
+            continue
+        top_idx, confidence, runner_up = _top2(probs)
+        preds.append({
+            "top_idx": top_idx,
+            "label": res.names[top_idx],
+            "confidence": confidence,
+            "margin": confidence - runner_up,
+            "stage": stage,
+        })
+    return preds
+
+
+def _run(model, img, stage):
+    return _run_batch(model, [img], stage)[0]
+
+
+class CascadeClassifier:
+    """Run ``small`` first and fall back to ``large`` only when it is unsure.
+
+    With no small model (or one trained on different classes) every request goes
+    straight to ``large``.
+    """
+
+    def __init__(self, large, small=None, min_confidence=CASCADE_MIN_CONFIDENCE,
+                 min_margin=CASCADE_MIN_MARGIN, audit_rate=CASCADE_AUDIT_RATE):
+        if small is not None and dict(small.names) != dict(large.names):
+            print("Warning: cascade small model has different classes from the main model. Cascade disabled.")
+            small = None
+        self.large = large
+        self.small = small
+        self.min_confidence = float(min_confidence)
+        self.min_margin = float(min_margin)
+        self.audit_rate = float(audit_rate)
+
+    @property
+    def names(self):
+        return self.large.names
+
+    def classify(self, img):
+        """Return a prediction dict (top_idx, label, confidence, margin, stage) or None."""
+        start = time.perf_counter()
+        try:
+            if self.small is None:
+                return _run(self.large, img, "large")
+
+            metrics.incr("cascade_requests")
+            pred = _run(self.small, img, "small")
+            if self._is_confident(pred):
+                if self.audit_rate and random.random() < self.audit_rate:
+                    reference = _run(self.large, img, "large")
+                    if reference is not None:
+                        agree = reference["top_idx"] == pred["top_idx"]
+                        metrics.incr("cascade_audit", "agree" if agree else "disagree")
+                return pred
+
+            metrics.incr("cascade_escalated")
+            escalated = _run(self.large, img, "large")
+            if pred is not None and escalated is not None:
+                agree = escalated["top_idx"] == pred["top_idx"]
+                metrics.incr("cascade_escalated_agreement", "agree" if agree else "disagree")
+            return escalated
+        finally:
+            metrics.observe("inference_total", time.perf_counter() - start)
+
+    def _is_confident(self, pred):
+        return (pred is not None and pred["confidence"] >= self.min_confidence
+                and pred["margin"] >= self.min_margin)
+
+    def classify_batch(self, images):
+        """Batched ``classify``: one small-model pass, then one large-model pass over
+        just the images that need escalating."""
+        if not images:
+            return []
+        start = time.perf_counter()
+        try:
+            if self.small is None:
+                return _run_batch(self.large, images, "large")
+
+            metrics.incr("cascade_requests", n=len(images))
+            preds = _run_batch(self.small, images, "small")
+            unsure = [i for i, pred in enumerate(preds) if not self._is_confident(pred)]
+            if unsure:
+                metrics.incr("cascade_escalated", n=len(unsure))
+                escalated = _run_batch(self.large, [images[i] for i in unsure], "large")
+                for i, pred in zip(unsure, escalated):
+                    if preds[i] is not None and pred is not None:
+                        agree = pred["top_idx"] == preds[i]["top_idx"]
+                        metrics.incr("cascade_escalated_agreement", "agree" if agree else "disagree")
+                    preds[i] = pred
+            return preds
+        finally:
+            # Named like _run_batch's timings: one observation per batch
+            name = "inference_total" if len(images) == 1 else "inference_total_batch"
+            metrics.observe(name, time.perf_counter() - start)
@@ -0,0 +1,231 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ---------------------- DEDUP SETTINGS ----------------------
+# Reports with the same label, inside DEDUP_RADIUS_M of an open incident and
+# seen within DEDUP_WINDOW_HOURS of its last report are merged into it.
+DEDUP_RADIUS_M = getattr(settings, "CIVICX_DEDUP_RADIUS_M", 50.0)
+DEDUP_WINDOW_HOURS = getattr(settings, "CIVICX_DEDUP_WINDOW_HOURS", 72.0)
+DEDUP_USE_EMBEDDINGS = getattr(settings, "CIVICX_DEDUP_USE_EMBEDDINGS", False)
+DEDUP_MIN_SIMILARITY = getattr(settings, "CIVICX_DEDUP_MIN_SIMILARITY", 0.85)
+DEDUP_DB = getattr(settings, "CIVICX_DEDUP_DB", os.path.join(BASE_DIR, "incidents.sqlite3"))
+# Open incidents past the window are marked expired at most this often
+DEDUP_SWEEP_INTERVAL_S = 60.0
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = 111320.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    incident_id TEXT PRIMARY KEY,
+    label TEXT NOT NULL,
+    department TEXT,
+    lat REAL,
+    lon REAL,
+    cell_y INTEGER,
+    cell_x INTEGER,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    report_count INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    embedding BLOB,
+    model_version TEXT
+);
+CREATE INDEX IF NOT EXISTS incidents_open_cell ON incidents (label, cell_y, cell_x) WHERE status = 'open';
+CREATE INDEX IF NOT EXISTS incidents_open_seen ON incidents (last_seen) WHERE status = 'open';
+"""
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _cosine(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    if denom == 0.0:
+        return 0.0
+    return float(np.dot(a, b) / denom)
+
+
+class IncidentIndex:
+    """Open incidents in SQLite, indexed by (label, lat cell, lon cell).
+
+    Cells are DEDUP_RADIUS_M wide, so a lookup only reads the incidents in the
+    neighbouring cells, and a report updates or inserts a single row. Every
+    process (web workers, run_ingest_worker) shares the same database.
+    """
+
+    def __init__(self, path=DEDUP_DB, radius_m=DEDUP_RADIUS_M,
+                 window_hours=DEDUP_WINDOW_HOURS, min_similarity=DEDUP_MIN_SIMILARITY):
+        self.path = path
+        self.radius_m = float(radius_m)
+        self.window_s = float(window_hours) * 3600.0
+        self.min_similarity = float(min_similarity)
+        self.cell_deg = self.radius_m / METERS_PER_DEGREE
+        self.local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    # ---------------------- persistence ----------------------
+    def _db(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+        return conn
+
+    # ---------------------- index maintenance ----------------------
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def _insert(self, conn, incident):
+        # Incidents without coordinates get no cell, so they are never merge candidates
+        located = incident["lat"] is not None and incident["lon"] is not None
+        cy, cx = self._cell(incident["lat"], incident["lon"]) if located else (None, None)
+        embedding = incident.get("embedding")
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32).tobytes()
+        conn.execute(
+            "INSERT OR REPLACE INTO incidents (incident_id, label, department, lat, lon, cell_y, cell_x, "
+            "first_seen, last_seen, report_count, status, embedding, model_version) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (incident["incident_id"], incident["label"], incident["department"], incident["lat"],
+             incident["lon"], cy, cx, incident["first_seen"], incident["last_seen"],
+             incident["report_count"], incident["status"], embedding, incident.get("model_version")),
+        )
+
+    def _candidates(self, conn, label, lat, lon, since):
+        cy, cx = self._cell(lat, lon)
+        # A degree of longitude shrinks with latitude, so widen the lon span
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        lon_span = int(math.ceil(1.0 / cos_lat))
+        return conn.execute(
+            "SELECT * FROM incidents WHERE status = 'open' AND label = ? AND cell_y BETWEEN ? AND ? "
+            "AND cell_x BETWEEN ? AND ? AND last_seen >= ?",
+            (label, cy - 1, cy + 1, cx - lon_span, cx + lon_span, since),
+        ).fetchall()
+
+    def sweep(self, now=None):
+        """Mark open incidents older than the window as expired; returns how many."""
+        now = time.time() if now is None else now
+        self._last_sweep = now
+        cur = self._db().execute(
+            "UPDATE incidents SET status = 'expired' WHERE status = 'open' AND last_seen < ?",
+            (now - self.window_s,),
+        )
+        return cur.rowcount
+
+    # ---------------------- public API ----------------------
+    def match_or_create(self, label, lat, lon, department, embedding=None, now=None, model_version=None):
+        """Return (incident, is_duplicate) for a new report.
+
+        Reports without usable coordinates always open a new incident (which is
+        stored, so its id can be looked up and closed like any other).
+        """
+        now = time.time() if now is None else now
+        lat, lon = _to_float(lat), _to_float(lon)
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32).ravel()
+
+        incident = {
+            "incident_id": uuid.uuid4().hex[:12],
+            "label": label,
+            "department": department,
+            "lat": lat,
+            "lon": lon,
+            "first_seen": now,
+            "last_seen": now,
+            "report_count": 1,
+            "status": "open",
+            "model_version": model_version,
+        }
+        conn = self._db()
+
+        if lat is None or lon is None:
+            self._insert(conn, incident)
+            return incident, False
+        if now - self._last_sweep > DEDUP_SWEEP_INTERVAL_S:
+            self.sweep(now)
+
+        # IMMEDIATE takes the write lock up front, so two processes can't both
+        # miss each other's report and open twin incidents
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            best, best_dist = None, None
+            for row in self._candidates(conn, label, lat, lon, now - self.window_s):
+                dist = _haversine_m(lat, lon, row["lat"], row["lon"])
+                if dist > self.radius_m:
+                    continue
+                # Embeddings are only comparable within one model version
+                if (embedding is not None and row["embedding"] is not None
+                        and row["model_version"] == model_version):
+                    if _cosine(embedding, np.frombuffer(row["embedding"], dtype=np.float32)) < self.min_similarity:
+                        continue
+                if best is None or dist < best_dist:
+                    best, best_dist = row, dist
+
+            if best is not None:
+                conn.execute(
+                    "UPDATE incidents SET report_count = report_count + 1, last_seen = ? WHERE incident_id = ?",
+                    (now, best["incident_id"]),
+                )
+                conn.execute("COMMIT")
+                merged = {k: best[k] for k in best.keys() if k not in ("embedding", "cell_y", "cell_x")}
+                merged.update(report_count=best["report_count"] + 1, last_seen=now)
+                return merged, True
+
+            self._insert(conn, dict(incident, embedding=embedding))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return incident, False
+
+    def close(self, incident_id):
+        self._db().execute("UPDATE incidents SET status = 'closed' WHERE incident_id = ?", (incident_id,))
+
+
+incident_index = IncidentIndex()
+
+
+def extract_embedding(model, img):
+    """Pooled backbone features for an image, or None if unavailable."""
+    if not DEDUP_USE_EMBEDDINGS or model is None:
+        return None
+    try:
+        feats = model.embed(img, verbose=False)
+        return feats[0].cpu().numpy() if feats else None
+    except Exception as e:
+        print("extract_embedding error:", e)
+        return None
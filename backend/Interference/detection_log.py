@@ -0,0 +1,410 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from django.conf import settings
+
+from .metrics import metrics
+from .rollups import parse_timestamp
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG_FILE = os.path.join(BASE_DIR, "detections_log.json")
+
+# ---------------------- LOG LIFECYCLE SETTINGS ----------------------
+# detections_log.json only holds recent detections; once it passes LOG_ROTATE_BYTES
+# or its oldest entry is LOG_ROTATE_DAYS old it is moved into a gzip JSONL segment.
+LOG_SEGMENTS_DIR = getattr(settings, "CIVICX_LOG_SEGMENTS_DIR", os.path.join(BASE_DIR, "detections_archive"))
+LOG_ROTATE_BYTES = getattr(settings, "CIVICX_LOG_ROTATE_BYTES", 1024 * 1024)
+LOG_ROTATE_DAYS = getattr(settings, "CIVICX_LOG_ROTATE_DAYS", 1)
+# Background compaction merges small neighbouring segments up to this (compressed) size
+LOG_SEGMENT_TARGET_BYTES = getattr(settings, "CIVICX_LOG_SEGMENT_TARGET_BYTES", 8 * 1024 * 1024)
+# Neither rotation nor compaction lets one segment cover more than this, so a short
+# range query decompresses at most a day of history per overlapping segment
+LOG_SEGMENT_MAX_SPAN_S = getattr(settings, "CIVICX_LOG_SEGMENT_MAX_SPAN_S", 86400)
+LOG_COMPACT_INTERVAL_S = getattr(settings, "CIVICX_LOG_COMPACT_INTERVAL_S", 300)
+# Segments whose newest detection is older than this are dropped; None keeps everything
+LOG_RETENTION_DAYS = getattr(settings, "CIVICX_LOG_RETENTION_DAYS", None)
+
+INDEX_NAME = "index.json"
+
+
+def _epoch(entry):
+    ts = parse_timestamp(entry.get("timestamp")) if isinstance(entry, dict) else None
+    return ts.timestamp() if ts is not None else None
+
+
+def _span_bucket(t, span):
+    return None if t is None else int(t // span)
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive advisory lock on ``path`` shared by every process using the log."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _read_segment(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class DetectionLog:
+    """The detection log: a small active JSON file plus compressed history segments.
+
+    ``index.json`` in the segments folder records each segment's first/last
+    timestamp, so range queries only open the segments that overlap the range
+    and the hot paths (append, latest) never touch history at all. Writers hold
+    ``<log>.lock`` so the web server, ingest worker and management commands can
+    share one log without losing each other's entries.
+    """
+
+    def __init__(self, path=LOG_FILE, segments_dir=LOG_SEGMENTS_DIR, rotate_bytes=LOG_ROTATE_BYTES,
+                 rotate_days=LOG_ROTATE_DAYS, target_bytes=LOG_SEGMENT_TARGET_BYTES,
+                 max_span_s=LOG_SEGMENT_MAX_SPAN_S):
+        self.path = path
+        self.segments_dir = segments_dir
+        self.index_path = os.path.join(segments_dir, INDEX_NAME)
+        self.rotate_bytes = int(rotate_bytes)
+        self.rotate_s = float(rotate_days) * 86400.0 if rotate_days else None
+        self.target_bytes = int(target_bytes)
+        self.max_span_s = float(max_span_s)
+        self.lock = threading.RLock()
+        self.lock_path = path + ".lock"
+        self._lock_depth = 0
+        # Active entries are cached and only re-read if another process changed the file
+        self._active = None
+        self._active_stat = None
+        self._active_size = 0
+        self._segments = None
+        self._index_stat = None
+        self._thread = None
+
+    @contextmanager
+    def locked(self):
+        """Thread lock plus the cross-process file lock; re-entrant within a process.
+
+        Hold it around ``iter_range``/``iter_all`` when every entry must be seen
+        (backfills, exports): otherwise a concurrent ``compact()`` in another
+        process can remove a segment before it is read.
+        """
+        with self.lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with _file_lock(self.lock_path):
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+
+    # ---------------------- active file ----------------------
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _load_active(self):
+        stat = self._stat(self.path)
+        if self._active is not None and stat == self._active_stat:
+            return self._active
+        data = []
+        if stat is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if not isinstance(data, list):
+                    # If the file contains a JSON object or other type, reset to list
+                    data = []
+            except (json.JSONDecodeError, ValueError):
+                # Empty or malformed JSON — reinitialize the log
+                print(f"Warning: '{self.path}' is empty or malformed. Reinitializing log file.")
+                data = []
+            except Exception as e:
+                print(f"Error reading log file '{self.path}':", e)
+                data = []
+        self._active = data
+        self._active_stat = stat
+        self._active_size = stat[2] if stat else 0
+        return data
+
+    def _write_active(self, data):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path)
+        self._active = data
+        self._active_stat = self._stat(self.path)
+        self._active_size = self._active_stat[2] if self._active_stat else 0
+
+    def append(self, entries):
+        """Append entries to the active file, rotating it afterwards if it is due."""
+        with self.locked():
+            data = list(self._load_active())
+            data.extend(entries)
+            try:
+                self._write_active(data)
+            except Exception as e:
+                print(f"Error writing to log file '{self.path}':", e)
+                return
+            if self._rotation_due(data):
+                self.rotate()
+
+    def latest(self):
+        with self.lock:
+            data = self._load_active()
+            if data:
+                return data[-1]
+            segments = self._load_index()
+        if not segments:
+            return None
+        # Index records carry their segment's last entry, so this never opens a segment
+        return max(segments, key=lambda s: s["end"] or 0)["last"]
+
+    def _rotation_due(self, data):
+        if not data:
+            return False
+        if self._active_size >= self.rotate_bytes:
+            return True
+        first = _epoch(data[0])
+        return self.rotate_s is not None and first is not None and time.time() - first >= self.rotate_s
+
+    # ---------------------- segment index ----------------------
+    def _load_index(self):
+        stat = self._stat(self.index_path)
+        if self._segments is not None and stat == self._index_stat:
+            return self._segments
+        segments = []
+        if stat is not None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    segments = json.load(f).get("segments", [])
+            except (json.JSONDecodeError, ValueError, OSError, AttributeError) as e:
+                print(f"Warning: could not read segment index '{self.index_path}':", e)
+                segments = []
+        self._segments = sorted(segments, key=lambda s: (s["start"] is None, s["start"] or 0))
+        self._index_stat = stat
+        return self._segments
+
+    def _write_index(self, segments):
+        os.makedirs(self.segments_dir, exist_ok=True)
+        segments = sorted(segments, key=lambda s: (s["start"] is None, s["start"] or 0))
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"segments": segments}, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+        self._segments = segments
+        self._index_stat = self._stat(self.index_path)
+
+    def _write_segment(self, entries):
+        """Write entries as a gzip JSONL segment and return its index record.
+
+        The file name is derived from the content, so re-running an interrupted
+        rotation finds the segment it already wrote instead of duplicating it.
+        """
+        os.makedirs(self.segments_dir, exist_ok=True)
+        lines = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries).encode("utf-8")
+        stamps = [t for t in (_epoch(e) for e in entries) if t is not None]
+        start, end = (min(stamps), max(stamps)) if stamps else (None, None)
+        prefix = time.strftime("%Y%m%dT%H%M%S", time.localtime(start)) if start is not None else "undated"
+        name = f"detections-{prefix}-{hashlib.sha1(lines).hexdigest()[:10]}.jsonl.gz"
+        path = os.path.join(self.segments_dir, name)
+        if not os.path.exists(path):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as gz:
+                    gz.write(lines)
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_path, path)
+        return {"file": name, "start": start, "end": end, "count": len(entries),
+                "bytes": os.path.getsize(path), "last": entries[-1]}
+
+    def _split_by_span(self, entries):
+        """Group entries into runs that each fit in one ``max_span_s`` window."""
+        groups = {}
+        for entry in entries:
+            groups.setdefault(_span_bucket(_epoch(entry), self.max_span_s), []).append(entry)
+        return list(groups.values())
+
+    def segments(self):
+        with self.lock:
+            return [dict(s) for s in self._load_index()]
+
+    # ---------------------- lifecycle ----------------------
+    def rotate(self):
+        """Move every active entry into new segments (one per span window); returns their records."""
+        with self.locked():
+            data = self._load_active()
+            if not data:
+                return []
+            records = [self._write_segment(group) for group in self._split_by_span(data)]
+            names = {r["file"] for r in records}
+            segments = [s for s in self._load_index() if s["file"] not in names]
+            self._write_index(segments + records)
+            self._write_active([])
+            metrics.incr("log_rotations")
+            print(f"Rotated {len(data)} detections into {len(records)} segment(s)")
+            return records
+
+    def compact(self):
+        """Merge runs of adjacent small segments into ~target_bytes segments.
+
+        Only segments inside the same ``max_span_s`` window are merged, so a quiet
+        week never collapses into one segment that every range query has to open.
+        """
+        merged = 0
+        with self.locked():
+            segments = list(self._load_index())
+            groups, group, size, window = [], [], 0, None
+            for seg in segments:
+                seg_window = _span_bucket(seg["start"], self.max_span_s)
+                small = (seg["bytes"] < self.target_bytes // 2
+                         and seg_window == _span_bucket(seg["end"], self.max_span_s))
+                if small and seg_window == window and size + seg["bytes"] <= self.target_bytes:
+                    group.append(seg)
+                    size += seg["bytes"]
+                    continue
+                groups.append(group)
+                group, size, window = ([seg], seg["bytes"], seg_window) if small else ([], 0, None)
+            groups.append(group)
+
+            for group in groups:
+                if len(group) < 2:
+                    continue
+                entries = []
+                for seg in group:
+                    entries.extend(_read_segment(os.path.join(self.segments_dir, seg["file"])))
+                record = self._write_segment(entries)
+                old = {seg["file"] for seg in group}
+                segments = [s for s in segments if s["file"] not in old] + [record]
+                self._write_index(segments)
+                for name in old - {record["file"]}:
+                    try:
+                        os.remove(os.path.join(self.segments_dir, name))
+                    except OSError:
+                        pass
+                merged += len(group)
+            if merged:
+                metrics.incr("log_compactions")
+                print(f"Compacted {merged} detection log segments")
+        return merged
+
+    def prune(self, before, archive_dir=None):
+        """Drop segments whose newest detection is older than ``before`` (epoch seconds).
+
+        With ``archive_dir`` the segment files are moved there instead of deleted.
+        """
+        with self.locked():
+            segments = self._load_index()
+            expired = [s for s in segments if s["end"] is not None and s["end"] < before]
+            if not expired:
+                return []
+            if archive_dir:
+                os.makedirs(archive_dir, exist_ok=True)
+            names = {s["file"] for s in expired}
+            self._write_index([s for s in segments if s["file"] not in names])
+            for seg in expired:
+                src = os.path.join(self.segments_dir, seg["file"])
+                try:
+                    if archive_dir:
+                        shutil.move(src, os.path.join(archive_dir, seg["file"]))
+                    else:
+                        os.remove(src)
+                except OSError as e:
+                    print(f"Could not remove segment {seg['file']}:", e)
+            return expired
+
+    def maintain(self, retention_days=LOG_RETENTION_DAYS):
+        with self.locked():
+            if self._rotation_due(self._load_active()):
+                self.rotate()
+            self.compact()
+            if retention_days:
+                self.prune(time.time() - float(retention_days) * 86400.0)
+
+    def start_background(self, interval=LOG_COMPACT_INTERVAL_S):
+        """Run ``maintain()`` every ``interval`` seconds in a daemon thread."""
+        if self._thread is not None or not interval:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.maintain()
+                except Exception as e:
+                    print("detection log maintenance error:", e)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    # ---------------------- reads ----------------------
+    def iter_range(self, start=None, end=None):
+        """Yield entries with ``start <= timestamp <= end`` (epoch seconds, either may be None).
+
+        Only segments whose [start, end] overlaps the range are opened.
+        """
+        with self.lock:
+            segments = list(self._load_index())
+            active = list(self._load_active())
+
+        def wanted(entry):
+            if start is None and end is None:
+                return True
+            t = _epoch(entry)
+            return t is not None and (start is None or t >= start) and (end is None or t <= end)
+
+        for seg in segments:
+            if seg["start"] is not None and ((end is not None and seg["start"] > end)
+                                             or (start is not None and seg["end"] < start)):
+                continue
+            path = os.path.join(self.segments_dir, seg["file"])
+            try:
+                for entry in _read_segment(path):
+                    if wanted(entry):
+                        yield entry
+            except OSError as e:
+                print(f"Could not read segment {seg['file']}:", e)
+        for entry in active:
+            if wanted(entry):
+                yield entry
+
+    def iter_all(self):
+        return self.iter_range()
+
+
+detection_log = DetectionLog()
@@ -0,0 +1,320 @@
+import atexit
+import hashlib
+import ipaddress
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from django.conf import settings
+
+from .metrics import metrics
+
+# ---------------------- POOL SETTINGS ----------------------
+# "host:port" of a running `manage.py run_inference_pool`; None keeps the model in-process
+POOL_ADDRESS = getattr(settings, "CIVICX_INFERENCE_POOL_ADDRESS", None)
+POOL_TIMEOUT_S = getattr(settings, "CIVICX_INFERENCE_POOL_TIMEOUT_S", 30.0)
+# Connection secret, from the environment. multiprocessing connections unpickle what
+# they receive, so whoever knows it can run code in the pool: without one the pool
+# only listens on / connects to loopback addresses.
+POOL_SECRET = getattr(settings, "CIVICX_INFERENCE_POOL_SECRET", None)
+# Calls one Django process can have in flight; each holds a connection and a
+# shared-memory slot, which are reused by later calls instead of being per thread
+POOL_CLIENT_SLOTS = getattr(settings, "CIVICX_INFERENCE_POOL_CLIENT_SLOTS", 8)
+# Shared-memory segments a worker keeps mapped (one per client slot, typically)
+WORKER_SHM_CACHE = 64
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def _is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def pool_authkey(address):
+    """Authkey for ``address``; refuses non-loopback addresses without POOL_SECRET."""
+    if POOL_SECRET:
+        return hashlib.sha256(("civicx-inference-pool:" + POOL_SECRET).encode()).digest()
+    if not _is_loopback(address[0]):
+        raise RuntimeError(f"Inference pool address {address[0]} is not loopback; "
+                           "set CIVICX_INFERENCE_POOL_SECRET in the environment to use it")
+    print("Warning: CIVICX_INFERENCE_POOL_SECRET is not set; inference pool is loopback-only")
+    return hashlib.sha256(("civicx-inference-pool:" + settings.SECRET_KEY).encode()).digest()
+
+
+def _attach(name):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # The client owns the segment; stop this process's resource tracker from unlinking it
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+# ---------------------- WORKER PROCESS ----------------------
+def _worker_main(worker_id, cores, threads, weights, small_weights, tasks, results):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+    import torch
+    from .model_manager import ModelVersion
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(threads)
+
+    mv = ModelVersion(weights, small_weights)
+    mv.warmup()
+    # Counters from here on are shipped back with each reply (see InferencePoolClient.classify)
+    metrics.reset()
+    results.put(("ready", worker_id, {"version": mv.version, "names": dict(mv.model.names)}))
+
+    attached = OrderedDict()
+    while True:
+        job = tasks.get()
+        if job is None:
+            break
+        job_id, shm_name, shape = job
+        try:
+            shm = attached.pop(shm_name, None) or _attach(shm_name)
+            attached[shm_name] = shm
+            while len(attached) > WORKER_SHM_CACHE:
+                attached.popitem(last=False)[1].close()
+            img = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            prediction = mv.classifier.classify(img)
+            delta = metrics.snapshot()
+            metrics.reset()
+            results.put(("result", job_id, {"ok": True, "prediction": prediction, "metrics": delta,
+                                            "version": mv.version, "worker": worker_id}))
+        except Exception as e:
+            results.put(("result", job_id, {"ok": False, "error": str(e)}))
+
+    for shm in attached.values():
+        shm.close()
+
+
+# ---------------------- DISPATCHER ----------------------
+class InferencePool:
+    """N model worker processes behind a local socket.
+
+    Each HTTP worker connects as a client and sends only the name and shape of a
+    shared-memory frame; workers read the pixels in place and reply with the
+    prediction dict, so model memory scales with ``workers`` only.
+    """
+
+    def __init__(self, weights, small_weights=None, workers=2, threads=None, address=POOL_ADDRESS):
+        cpu_count = os.cpu_count() or 1
+        self.weights = weights
+        self.small_weights = small_weights
+        self.n_workers = workers
+        self.threads = threads or max(1, cpu_count // workers)
+        self.address = parse_address(address or "127.0.0.1:6010")
+        self.authkey = pool_authkey(self.address)
+        self.tasks = mp.Queue()
+        self.results = mp.Queue()
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.job_ids = itertools.count()
+        self.info = None
+        self.ready = threading.Event()
+        self.processes = {}
+
+    def _cores(self, worker_id):
+        cpu_count = os.cpu_count() or 1
+        start = worker_id * self.threads
+        return {c % cpu_count for c in range(start, start + self.threads)}
+
+    def _spawn(self, worker_id):
+        p = mp.Process(target=_worker_main, daemon=True,
+                       args=(worker_id, self._cores(worker_id), self.threads, self.weights,
+                             self.small_weights, self.tasks, self.results))
+        p.start()
+        self.processes[worker_id] = p
+
+    def _route_results(self):
+        while True:
+            kind, key, payload = self.results.get()
+            if kind == "ready":
+                print(f"inference worker {key} ready ({payload['version']})")
+                self.info = payload
+                self.ready.set()
+                continue
+            with self.pending_lock:
+                waiter = self.pending.pop(key, None)
+            if waiter is not None:
+                waiter.put(payload)
+
+    def _monitor(self):
+        while True:
+            time.sleep(2)
+            for worker_id, p in list(self.processes.items()):
+                if not p.is_alive():
+                    print(f"inference worker {worker_id} exited ({p.exitcode}); restarting")
+                    self._spawn(worker_id)
+
+    def submit(self, shm_name, shape):
+        job_id = next(self.job_ids)
+        waiter = queue.Queue(maxsize=1)
+        with self.pending_lock:
+            self.pending[job_id] = waiter
+        self.tasks.put((job_id, shm_name, tuple(shape)))
+        try:
+            return waiter.get(timeout=POOL_TIMEOUT_S)
+        except queue.Empty:
+            with self.pending_lock:
+                self.pending.pop(job_id, None)
+            return {"ok": False, "error": "inference timed out"}
+
+    def _serve_client(self, conn):
+        try:
+            while True:
+                msg = conn.recv()
+                if msg.get("op") == "info":
+                    conn.send(self.info)
+                elif msg.get("op") == "classify":
+                    conn.send(self.submit(msg["shm"], msg["shape"]))
+                else:
+                    conn.send({"ok": False, "error": f"unknown op {msg.get('op')!r}"})
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        threading.Thread(target=self._route_results, daemon=True).start()
+        for worker_id in range(self.n_workers):
+            self._spawn(worker_id)
+        self.ready.wait()
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+        print(f"Inference pool: {self.n_workers} workers x {self.threads} threads on "
+              f"{self.address[0]}:{self.address[1]}")
+        with Listener(self.address, authkey=self.authkey) as listener:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print("inference pool accept error:", e)
+                    continue
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+
+# ---------------------- CLIENT (inside Django) ----------------------
+class InferencePoolClient:
+    """Drop-in for CascadeClassifier that forwards frames to the pool.
+
+    Calls check out one of at most ``slots`` channels (a connection plus a
+    reusable shared-memory slot that grows to the largest frame sent through it)
+    and return it afterwards, so a threaded server does not leak one of each per
+    request thread.
+    """
+
+    def __init__(self, address=POOL_ADDRESS, slots=POOL_CLIENT_SLOTS):
+        self.address = parse_address(address)
+        self.authkey = pool_authkey(self.address)
+        self.version = None  # model version named by the most recent reply
+        self.available = threading.BoundedSemaphore(slots)
+        self.idle = []       # channels not checked out: {"conn": ..., "shm": ...}
+        self.channels = []   # every channel, for close()
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _checkout(self):
+        if not self.available.acquire(timeout=POOL_TIMEOUT_S):
+            metrics.incr("inference_pool_errors")
+            raise TimeoutError("all inference pool slots are busy")
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            channel = {"conn": None, "shm": None}
+            self.channels.append(channel)
+            return channel
+
+    def _checkin(self, channel):
+        with self.lock:
+            self.idle.append(channel)
+        self.available.release()
+
+    def _slot(self, channel, nbytes):
+        shm = channel["shm"]
+        if shm is None or shm.size < nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = channel["shm"] = shared_memory.SharedMemory(create=True, size=nbytes)
+        return shm
+
+    def _call(self, channel, msg):
+        if channel["conn"] is None:
+            channel["conn"] = Client(self.address, authkey=self.authkey)
+        conn = channel["conn"]
+        try:
+            conn.send(msg)
+            if not conn.poll(POOL_TIMEOUT_S + 5):
+                raise TimeoutError("inference pool did not answer")
+            return conn.recv()
+        except Exception:
+            # Drop the connection so the next call reconnects cleanly
+            channel["conn"] = None
+            conn.close()
+            raise
+
+    def info(self):
+        channel = self._checkout()
+        try:
+            info = self._call(channel, {"op": "info"})
+        finally:
+            self._checkin(channel)
+        self.version = info["version"]
+        return info
+
+    def classify(self, img):
+        start = time.perf_counter()
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        channel = self._checkout()
+        try:
+            shm = self._slot(channel, img.nbytes)
+            np.ndarray(img.shape, dtype=np.uint8, buffer=shm.buf)[...] = img
+            reply = self._call(channel, {"op": "classify", "shm": shm.name, "shape": img.shape})
+        finally:
+            self._checkin(channel)
+        metrics.observe("inference_pool_roundtrip", time.perf_counter() - start)
+        if not reply.get("ok"):
+            metrics.incr("inference_pool_errors")
+            raise RuntimeError(reply.get("error", "inference failed"))
+        self.version = reply.get("version", self.version)
+        # Cascade/inference counters are recorded in the worker; fold them into ours
+        if reply.get("metrics"):
+            metrics.merge(reply["metrics"])
+        return reply["prediction"]
+
+    def classify_batch(self, images):
+        return [self.classify(img) for img in images]
+
+    def close(self):
+        with self.lock:
+            channels, self.channels, self.idle = self.channels, [], []
+        for channel in channels:
+            try:
+                if channel["conn"] is not None:
+                    channel["conn"].close()
+                if channel["shm"] is not None:
+                    channel["shm"].close()
+                    channel["shm"].unlink()
+            except Exception:
+                pass
@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ---------------------- INGEST SETTINGS ----------------------
+# When true, reportIssue queues uploads and returns a job id instead of classifying inline
+INGEST_ASYNC = getattr(settings, "CIVICX_INGEST_ASYNC", False)
+INGEST_DB = getattr(settings, "CIVICX_INGEST_DB", os.path.join(BASE_DIR, "ingest_queue.sqlite3"))
+INGEST_UPLOADS_DIR = getattr(settings, "CIVICX_INGEST_UPLOADS_DIR", os.path.join(BASE_DIR, "ingest_uploads"))
+# A job claimed longer than this ago is assumed lost (worker died) and is re-queued
+INGEST_LEASE_S = getattr(settings, "CIVICX_INGEST_LEASE_S", 300)
+INGEST_MAX_ATTEMPTS = getattr(settings, "CIVICX_INGEST_MAX_ATTEMPTS", 3)
+# A job put back after a transient error (e.g. the inference pool restarting) waits
+# this long before it can be claimed again, doubling with each attempt
+INGEST_RETRY_BACKOFF_S = getattr(settings, "CIVICX_INGEST_RETRY_BACKOFF_S", 5.0)
+INGEST_RETRY_BACKOFF_MAX_S = 300.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    image_path TEXT NOT NULL,
+    image_info TEXT NOT NULL,
+    lat TEXT,
+    lon TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+"""
+
+
+class IngestQueue:
+    """Durable job queue for report uploads: one SQLite file plus an uploads folder.
+
+    Jobs move queued -> processing -> done/failed; the image bytes are written to
+    disk before the row is committed so an accepted job never loses its upload.
+    """
+
+    def __init__(self, db_path=INGEST_DB, uploads_dir=INGEST_UPLOADS_DIR,
+                 lease_s=INGEST_LEASE_S, max_attempts=INGEST_MAX_ATTEMPTS,
+                 retry_backoff_s=INGEST_RETRY_BACKOFF_S):
+        self.db_path = db_path
+        self.uploads_dir = uploads_dir
+        self.lease_s = float(lease_s)
+        self.max_attempts = int(max_attempts)
+        self.retry_backoff_s = float(retry_backoff_s)
+        self.local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _db(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    os.makedirs(self.uploads_dir, exist_ok=True)
+                    self._initialized = True
+        return conn
+
+    def enqueue(self, data, info, lat=None, lon=None):
+        conn = self._db()
+        job_id = uuid.uuid4().hex
+        image_path = os.path.join(self.uploads_dir, f"{job_id}.{info['format']}")
+        with open(image_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        now = time.time()
+        conn.execute(
+            "INSERT INTO jobs (id, status, created, updated, image_path, image_info, lat, lon) "
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, now, now, image_path, json.dumps(info), lat, lon),
+        )
+        return job_id
+
+    def claim(self, limit, worker):
+        """Atomically move up to ``limit`` queued (or lease-expired) jobs to processing.
+
+        Jobs backing off after ``retry()`` are skipped until their ``not_before``.
+        """
+        conn = self._db()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute(
+                "SELECT image_path FROM jobs WHERE status = 'processing' AND updated < ? AND attempts >= ?",
+                (now - self.lease_s, self.max_attempts),
+            ).fetchall()
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'too many attempts', updated = ? "
+                "WHERE status = 'processing' AND updated < ? AND attempts >= ?",
+                (now, now - self.lease_s, self.max_attempts),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'processing' AND updated < ?",
+                (now - self.lease_s,),
+            )
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND not_before <= ? ORDER BY created LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE jobs SET status = 'processing', worker = ?, updated = ?, attempts = attempts + 1 "
+                    "WHERE id = ?",
+                    [(worker, now, row["id"]) for row in rows],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for row in expired:
+            self._remove_upload(row["image_path"])
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["image_info"] = json.loads(job["image_info"])
+            jobs.append(job)
+        return jobs
+
+    def complete(self, job_id, result):
+        self._db().execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated = ? WHERE id = ?",
+            (json.dumps(result), time.time(), job_id),
+        )
+
+    def _remove_upload(self, image_path):
+        try:
+            os.remove(image_path)
+        except OSError:
+            pass
+
+    def fail(self, job_id, error):
+        conn = self._db()
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+            (str(error), time.time(), job_id),
+        )
+        row = conn.execute("SELECT image_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is not None:
+            self._remove_upload(row["image_path"])
+
+    def retry(self, job_id, error):
+        """Put a job that hit a transient error back in the queue after a backoff,
+        or fail it once it has used up its attempts."""
+        conn = self._db()
+        row = conn.execute("SELECT attempts FROM jobs WHERE id = ? AND status = 'processing'",
+                           (job_id,)).fetchone()
+        if row is None:
+            return
+        if row["attempts"] >= self.max_attempts:
+            self.fail(job_id, error)
+            return
+        now = time.time()
+        delay = min(self.retry_backoff_s * 2 ** (row["attempts"] - 1), INGEST_RETRY_BACKOFF_MAX_S)
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', error = ?, updated = ?, not_before = ? "
+            "WHERE id = ? AND status = 'processing'",
+            (str(error), now, now + delay, job_id),
+        )
+
+    def get(self, job_id):
+        row = self._db().execute(
+            "SELECT id, status, created, updated, attempts, result, error FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def counts(self):
+        rows = self._db().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,52 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Interference.detection_log import detection_log, LOG_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    help = "Rotate, compact and expire the detection log's compressed segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rotate", action="store_true", help="Move the active log into a segment now")
+        parser.add_argument("--compact", action="store_true", help="Merge small adjacent segments")
+        parser.add_argument("--retention-days", type=float, default=None,
+                            help="Expire segments older than this (default CIVICX_LOG_RETENTION_DAYS)")
+        parser.add_argument("--archive-dir", help="Move expired segments here instead of deleting them")
+        parser.add_argument("--list", action="store_true", help="Print the segment index")
+
+    def handle(self, *args, **options):
+        ran = False
+        if options["rotate"]:
+            ran = True
+            records = detection_log.rotate()
+            names = ", ".join(r["file"] for r in records)
+            self.stdout.write(f"rotated: {names or 'active log is empty'}")
+        if options["compact"]:
+            ran = True
+            self.stdout.write(f"compacted {detection_log.compact()} segments")
+
+        retention = options["retention_days"] if options["retention_days"] is not None else LOG_RETENTION_DAYS
+        if options["retention_days"] is not None or options["archive_dir"]:
+            ran = True
+            if not retention:
+                raise CommandError("Give --retention-days (CIVICX_LOG_RETENTION_DAYS is not set)")
+            expired = detection_log.prune(time.time() - float(retention) * 86400.0, options["archive_dir"])
+            action = f"moved to {options['archive_dir']}" if options["archive_dir"] else "deleted"
+            self.stdout.write(f"expired {len(expired)} segments ({action})")
+
+        if not ran:
+            detection_log.maintain()
+            self.stdout.write("ran rotation, compaction and retention")
+
+        if options["list"] or not ran:
+            total = 0
+            for seg in detection_log.segments():
+                total += seg["count"]
+                bounds = [datetime.datetime.fromtimestamp(t).isoformat(" ", "seconds") if t else "-"
+                          for t in (seg["start"], seg["end"])]
+                self.stdout.write(f"{seg['file']:55} {bounds[0]:19} .. {bounds[1]:19} "
+                                  f"{seg['count']:>8} {seg['bytes'] / 1024:>9.1f} KiB")
+            self.stdout.write(self.style.SUCCESS(f"{total} archived detections in {detection_log.segments_dir}"))
@@ -0,0 +1,32 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Interference.detection_log import detection_log
+from Interference.rollups import rollup_store
+from Interference.routing import routing_table
+
+
+class Command(BaseCommand):
+    help = "Rebuild the hourly/daily detection rollups from the detection log and its archived segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--log-file", help="Read this JSON array instead of the app's detection log.")
+
+    def handle(self, *args, **options):
+        log_file = options["log_file"]
+        if log_file:
+            if not os.path.exists(log_file):
+                raise CommandError(f"Log file not found: {log_file}")
+            with open(log_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, list):
+                raise CommandError(f"Log file is not a JSON array: {log_file}")
+            count = rollup_store.backfill(data, routing_table.department_for_entry)
+        else:
+            # Holding the log lock keeps compaction from removing a segment mid-read
+            # and appends from landing between the read and the rebuild
+            with detection_log.locked():
+                count = rollup_store.backfill(detection_log.iter_all(), routing_table.department_for_entry)
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {count} detections into {rollup_store.path}"))
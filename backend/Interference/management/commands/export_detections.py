@@ -0,0 +1,42 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Interference.detection_log import detection_log
+from Interference.records import DetectionTable, EXPORT_FORMATS
+from Interference.rollups import parse_timestamp
+from Interference.routing import routing_table
+
+
+class Command(BaseCommand):
+    help = "Export detections (active log plus archived segments) to Parquet or Arrow for analytics."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Output file, e.g. detections.parquet")
+        parser.add_argument("--format", choices=EXPORT_FORMATS,
+                            help="Defaults to the output extension (.parquet, else arrow)")
+        parser.add_argument("--start", help="Only detections at or after this ISO datetime")
+        parser.add_argument("--end", help="Only detections at or before this ISO datetime")
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or ("parquet" if options["output"].endswith(".parquet") else "arrow")
+        bounds = []
+        for key in ("start", "end"):
+            ts = parse_timestamp(options[key]) if options[key] else None
+            if options[key] and ts is None:
+                raise CommandError(f"--{key} must be an ISO datetime")
+            bounds.append(ts.timestamp() if ts else None)
+
+        with detection_log.locked():
+            table = DetectionTable.from_entries(detection_log.iter_range(*bounds),
+                                                routing_table.department_for_entry)
+        try:
+            rows = table.export(options["output"], fmt)
+        except ImportError as e:
+            raise CommandError(str(e))
+
+        size = os.path.getsize(options["output"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {rows} detections to {options['output']} ({fmt}, {size / 1024:.1f} KiB, "
+            f"{table.nbytes() / max(rows, 1):.0f} B/detection in memory)"
+        ))
@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Interference.inference_pool import InferencePool, POOL_ADDRESS
+
+
+class Command(BaseCommand):
+    help = "Run the shared model worker pool used when CIVICX_INFERENCE_POOL_ADDRESS is set."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Model worker processes")
+        parser.add_argument("--threads", type=int, default=None,
+                            help="Torch intra-op threads per worker (default: cpu_count // workers)")
+        parser.add_argument("--weights", default=None, help="Weights file (default: the first existing model_manager.MODEL_PATHS entry)")
+        parser.add_argument("--small-weights", default=None, help="Optional cascade first-stage weights")
+        parser.add_argument("--address", default=POOL_ADDRESS or "127.0.0.1:6010", help="host:port to listen on")
+
+    def handle(self, *args, **options):
+        weights = options["weights"]
+        if weights is None:
+            from Interference.model_manager import default_weights
+            weights = default_weights()
+        elif not os.path.exists(weights):
+            raise CommandError(f"Weights not found: {weights}")
+
+        pool = InferencePool(weights, options["small_weights"], workers=options["workers"],
+                             threads=options["threads"], address=options["address"])
+        try:
+            pool.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Inference pool stopped.")
@@ -0,0 +1,42 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from Interference.ingest_queue import ingest_queue
+
+
+class Command(BaseCommand):
+    help = "Classify, route and save reports queued by reportIssue in async mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=8, help="Jobs claimed and classified together")
+        parser.add_argument("--poll", type=float, default=0.5, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit")
+
+    def handle(self, *args, **options):
+        # Importing the views loads the model (or attaches to the inference pool)
+        from Interference.views import process_ingest_batch
+
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Ingest worker {worker} polling {ingest_queue.db_path}")
+        while True:
+            jobs = ingest_queue.claim(options["batch"], worker)
+            if not jobs:
+                if options["once"]:
+                    break
+                time.sleep(options["poll"])
+                continue
+            start = time.perf_counter()
+            try:
+                done = process_ingest_batch(jobs)
+            except Exception as e:
+                # Never leave claimed jobs waiting for their lease to expire
+                self.stderr.write(f"batch failed: {e}")
+                for job in jobs:
+                    ingest_queue.retry(job["id"], e)
+                done = 0
+            counts = ingest_queue.counts()
+            self.stdout.write(f"processed {done}/{len(jobs)} jobs in {time.perf_counter() - start:.2f}s "
+                              f"(queued {counts.get('queued', 0)}, failed {counts.get('failed', 0)})")
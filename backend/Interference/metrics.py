@@ -0,0 +1,72 @@
+import threading
+
+
+class Metrics:
+    """Process-local counters and timings exposed by /Interference/metrics/."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}
+
+    def incr(self, name, key=None, n=1):
+        with self.lock:
+            if key is None:
+                self.counters[name] = self.counters.get(name, 0) + n
+            else:
+                bucket = self.counters.setdefault(name, {})
+                bucket[key] = bucket.get(key, 0) + n
+
+    def set(self, name, value, key=None):
+        with self.lock:
+            if key is None:
+                self.counters[name] = value
+            else:
+                self.counters.setdefault(name, {})[key] = value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            t = self.timings.get(name)
+            if t is None:
+                t = {"count": 0, "total_s": 0.0, "min_s": seconds, "max_s": seconds}
+                self.timings[name] = t
+            t["count"] += 1
+            t["total_s"] += seconds
+            t["min_s"] = min(t["min_s"], seconds)
+            t["max_s"] = max(t["max_s"], seconds)
+
+    def snapshot(self):
+        with self.lock:
+            counters = {k: (dict(v) if isinstance(v, dict) else v) for k, v in self.counters.items()}
+            timings = {}
+            for name, t in self.timings.items():
+                timings[name] = dict(t, mean_s=t["total_s"] / t["count"] if t["count"] else 0.0)
+        return {"counters": counters, "timings": timings}
+
+    def merge(self, snapshot):
+        """Add another process's ``snapshot()`` (e.g. an inference pool worker's) into this one."""
+        with self.lock:
+            for name, value in snapshot.get("counters", {}).items():
+                if isinstance(value, dict):
+                    bucket = self.counters.setdefault(name, {})
+                    for key, n in value.items():
+                        bucket[key] = bucket.get(key, 0) + n
+                else:
+                    self.counters[name] = self.counters.get(name, 0) + value
+            for name, other in snapshot.get("timings", {}).items():
+                t = self.timings.get(name)
+                if t is None:
+                    self.timings[name] = {k: other[k] for k in ("count", "total_s", "min_s", "max_s")}
+                    continue
+                t["count"] += other["count"]
+                t["total_s"] += other["total_s"]
+                t["min_s"] = min(t["min_s"], other["min_s"])
+                t["max_s"] = max(t["max_s"], other["max_s"])
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timings.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,231 @@
+import datetime
+import hashlib
+import os
+import threading
+
+import numpy as np
+from ultralytics import YOLO
+
+from .cascade import CascadeClassifier
+from .metrics import metrics
+from .routing import routing_table
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS_DIR = os.path.join(BASE_DIR, "runs", "classify")
+# Weights may only be loaded from here (a .pt file is a pickle, so never from arbitrary paths)
+ALLOWED_WEIGHT_DIRS = (os.path.join(BASE_DIR, "runs"), os.path.join(BASE_DIR, "models"))
+WARMUP_RUNS = 3
+
+# Default weights: the first of these that exists
+MODEL_PATHS = [
+    r"D:/CivicX-Final/CivicX-1/backend/runs/classify/civicx_cls_model6/weights/best.pt",
+    os.path.join(BASE_DIR, "runs", "classify", "civicx_cls_model6", "weights", "best.pt"),
+    os.path.join(BASE_DIR, "models", "best.pt"),
+    "yolov8n-cls.pt"  # fallback to default YOLOv8 classification model
+]
+
+
+def default_weights():
+    for path in MODEL_PATHS:
+        if os.path.exists(path):
+            return path
+    print("Warning: No model file found. Using default YOLOv8 classification model.")
+    return "yolov8n-cls.pt"  # This will auto-download if not present
+
+
+def _version_id(path):
+    """Short, stable id for a weights file: <run or file name>-<content hash>."""
+    parts = os.path.normpath(path).split(os.sep)
+    name = parts[-3] if len(parts) >= 3 and parts[-2] == "weights" else os.path.basename(path)
+    if not os.path.exists(path):
+        return name
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return f"{name}-{h.hexdigest()[:8]}"
+
+
+def resolve_weights(run=None, path=None):
+    """Map a run name or a path to a weights file inside ALLOWED_WEIGHT_DIRS."""
+    if run:
+        path = os.path.join(RUNS_DIR, run, "weights", "best.pt")
+    if not path:
+        raise ValueError("Provide a run name or weights path")
+    path = os.path.realpath(path if os.path.isabs(path) else os.path.join(BASE_DIR, path))
+    if not any(path.startswith(os.path.realpath(d) + os.sep) for d in ALLOWED_WEIGHT_DIRS):
+        raise ValueError("Weights must live under runs/ or models/")
+    if not os.path.exists(path):
+        raise ValueError(f"Weights not found: {os.path.relpath(path, BASE_DIR)}")
+    return path
+
+
+class ModelUnavailable(RuntimeError):
+    """No model version can serve requests (e.g. the inference pool is not reachable)."""
+
+
+class ModelVersion:
+    """Everything a request needs from one loaded model, swapped as a unit."""
+
+    def __init__(self, path, small_path=None):
+        self.path = path
+        self.small_path = small_path
+        self.version = _version_id(path)
+        self.model = YOLO(path)
+        small = YOLO(small_path) if small_path else None
+        self.classifier = CascadeClassifier(self.model, small)
+        self.routes = routing_table.compile(self.model.names)
+        self.loaded_at = str(datetime.datetime.now())
+
+    def warmup(self, runs=WARMUP_RUNS):
+        # Call the models directly: going through the classifier would count the
+        # blank frames in the cascade and inference metrics
+        dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+        for model in (self.model, self.classifier.small):
+            if model is not None:
+                for _ in range(runs):
+                    model(dummy, verbose=False)
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "path": os.path.relpath(self.path, BASE_DIR) if os.path.isabs(self.path) else self.path,
+            "small_path": self.small_path,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class RemoteModelVersion:
+    """A model version served by the out-of-process inference pool.
+
+    Only the class names are fetched (to compile routes); the weights stay in the
+    pool's worker processes.
+    """
+
+    def __init__(self, client):
+        info = client.info()
+        self.path = "inference-pool"
+        self.small_path = None
+        self.version = info["version"]
+        self.model = None
+        self.classifier = client
+        self.routes = routing_table.compile({int(k): v for k, v in info["names"].items()})
+        self.loaded_at = str(datetime.datetime.now())
+
+    def describe(self):
+        return {"version": self.version, "path": self.path, "small_path": None, "loaded_at": self.loaded_at}
+
+
+class ModelManager:
+    """Holds the active ModelVersion and swaps in new ones without a restart.
+
+    Request handlers call ``current()`` once and use that object for the whole
+    request, so in-flight requests finish on the version they started with while
+    new requests pick up the swapped-in one.
+    """
+
+    def __init__(self):
+        self.active = None
+        self.previous = None
+        self.lock = threading.Lock()
+        self.loading = None
+        self.last_error = None
+        self.remote = None
+
+    def current(self):
+        mv = self.active
+        # Pool mode: connect on first use, and refresh names/routes if the pool
+        # was restarted with other weights
+        if self.remote is not None and (mv is None or self.remote.version != mv.version):
+            try:
+                self._activate(RemoteModelVersion(self.remote))
+            except Exception as e:
+                if mv is None:
+                    raise ModelUnavailable(f"Inference pool at {self._pool_address()} is not reachable: {e}")
+                print("inference pool refresh failed:", e)
+            mv = self.active
+        if mv is None:
+            raise ModelUnavailable("No model is loaded")
+        return mv
+
+    def _pool_address(self):
+        return "{}:{}".format(*self.remote.address)
+
+    def attach_pool(self, client):
+        """Serve predictions from an InferencePoolClient instead of an in-process model.
+
+        If the pool is not up yet the connection is retried on the next request.
+        """
+        self.remote = client
+        try:
+            self._activate(RemoteModelVersion(client))
+        except Exception as e:
+            print(f"Warning: inference pool at {self._pool_address()} is not reachable ({e}); "
+                  "requests will fail with 503 until it is")
+
+    def _activate(self, mv):
+        with self.lock:
+            if self.active is not None:
+                self.previous = self.active
+            self.active = mv
+        metrics.incr("model_swaps")
+        print(f"Model version {mv.version} is now active")
+
+    def load_sync(self, path, small_path=None, warmup=True):
+        print(f"Loading model from: {path}")
+        mv = ModelVersion(path, small_path)
+        if warmup:
+            mv.warmup()
+        self._activate(mv)
+        return mv
+
+    def load_async(self, path, small_path=None):
+        """Load and warm up in a background thread; returns False if a load is already running."""
+        if self.remote is not None:
+            raise RuntimeError("Model versions are managed by the inference pool")
+        with self.lock:
+            if self.loading is not None:
+                return False
+            self.loading = path
+            self.last_error = None
+
+        def run():
+            try:
+                self.load_sync(path, small_path)
+            except Exception as e:
+                print(f"Model load failed for {path}:", e)
+                self.last_error = str(e)
+                metrics.incr("model_load_failures")
+            finally:
+                with self.lock:
+                    self.loading = None
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def rollback(self):
+        if self.remote is not None:
+            raise RuntimeError("Model versions are managed by the inference pool")
+        with self.lock:
+            if self.previous is None:
+                return None
+            self.active, self.previous = self.previous, self.active
+            mv = self.active
+        metrics.incr("model_rollbacks")
+        print(f"Rolled back to model version {mv.version}")
+        return mv
+
+    def status(self):
+        with self.lock:
+            return {
+                "active": self.active.describe() if self.active else None,
+                "previous": self.previous.describe() if self.previous else None,
+                "loading": os.path.relpath(self.loading, BASE_DIR) if self.loading else None,
+                "last_error": self.last_error,
+                "inference_pool": self._pool_address() if self.remote else None,
+                # Versions are per process; other workers may be on a different one
+                "pid": os.getpid(),
+            }
+
+
+model_manager = ModelManager()
@@ -0,0 +1,95 @@
+import hmac
+import json
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from .model_manager import model_manager, resolve_weights
+
+# Shared secret for the load/rollback endpoints, sent as "Authorization: Bearer <token>".
+# Unset means those endpoints are disabled.
+MODEL_ADMIN_TOKEN = getattr(settings, "CIVICX_MODEL_ADMIN_TOKEN", None)
+
+
+def _params(request):
+    """POST fields or the JSON object body; None if the body is not a JSON object."""
+    if request.content_type == 'application/json':
+        try:
+            params = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return params if isinstance(params, dict) else None
+    return request.POST
+
+
+def _forbidden(request):
+    """None if the request carries the admin token, else the error response."""
+    if not MODEL_ADMIN_TOKEN:
+        return JsonResponse({"error": "Model management is disabled (CIVICX_MODEL_ADMIN_TOKEN is not set)"},
+                            status=403)
+    header = request.headers.get('Authorization', '')
+    token = header[7:] if header.startswith('Bearer ') else ''
+    if not hmac.compare_digest(token.encode(), MODEL_ADMIN_TOKEN.encode()):
+        return JsonResponse({"error": "Invalid or missing admin token"}, status=403)
+    return None
+
+
+def model_status(request):
+    """Active/previous model versions and any load in progress."""
+    return JsonResponse(model_manager.status())
+
+
+@csrf_exempt
+def load_model(request):
+    """Load new weights in the background, warm them up, then swap them in.
+    POST fields: run (e.g. civicx_cls_model6) or path (under runs/ or models/),
+    optional small_run/small_path for the cascade's first stage.
+    Requires "Authorization: Bearer <CIVICX_MODEL_ADMIN_TOKEN>".
+
+    The swap only happens in the process that handles this request: other
+    gunicorn workers and run_ingest_worker keep their version until they are
+    restarted (or receive the same request). The response's "pid" says which
+    process was updated.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error": "Send POST request."}, status=400)
+    denied = _forbidden(request)
+    if denied:
+        return denied
+
+    params = _params(request)
+    if params is None:
+        return JsonResponse({"error": "Request body must be a JSON object."}, status=400)
+    try:
+        path = resolve_weights(params.get('run'), params.get('path'))
+        small_path = None
+        if params.get('small_run') or params.get('small_path'):
+            small_path = resolve_weights(params.get('small_run'), params.get('small_path'))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        started = model_manager.load_async(path, small_path)
+    except RuntimeError as e:
+        return JsonResponse({"error": str(e)}, status=409)
+    if not started:
+        return JsonResponse({"error": "A model load is already in progress"}, status=409)
+    return JsonResponse({"status": "loading", **model_manager.status()}, status=202)
+
+
+@csrf_exempt
+def rollback_model(request):
+    """Swap the previous model version back in (this process only; see load_model)."""
+    if request.method != 'POST':
+        return JsonResponse({"error": "Send POST request."}, status=400)
+    denied = _forbidden(request)
+    if denied:
+        return denied
+    try:
+        mv = model_manager.rollback()
+    except RuntimeError as e:
+        return JsonResponse({"error": str(e)}, status=409)
+    if mv is None:
+        return JsonResponse({"error": "No previous model version to roll back to"}, status=409)
+    return JsonResponse({"status": "rolled_back", **model_manager.status()})
@@ -0,0 +1,204 @@
+import atexit
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROLLUPS_DB = getattr(settings, "CIVICX_ROLLUPS_DB", os.path.join(BASE_DIR, "rollups.sqlite3"))
+
+# Counts are added to the database at most this often; detections in between are
+# held as in-memory deltas (and flushed again at interpreter exit).
+ROLLUP_FLUSH_INTERVAL_S = getattr(settings, "CIVICX_ROLLUP_FLUSH_INTERVAL_S", 5.0)
+
+GRANULARITIES = {
+    "hour": ("%Y-%m-%dT%H", datetime.timedelta(hours=1)),
+    "day": ("%Y-%m-%d", datetime.timedelta(days=1)),
+}
+DIMENSIONS = ("class", "department", "city")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, dimension, value)
+) WITHOUT ROWID;
+"""
+
+
+def parse_timestamp(value):
+    """Parse a detection timestamp (``str(datetime.now())`` format) or ISO date.
+
+    Detections are logged in server local time, so aware values are converted
+    to naive local time.
+    """
+    if not isinstance(value, datetime.datetime):
+        try:
+            value = datetime.datetime.fromisoformat(str(value).strip())
+        except (TypeError, ValueError):
+            return None
+    if value.tzinfo is not None:
+        try:
+            value = value.astimezone().replace(tzinfo=None)
+        except (OverflowError, ValueError, OSError):
+            return None
+    return value
+
+
+def bucket_start(ts, granularity):
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class RollupStore:
+    """Hourly and daily detection counters per class, department and city.
+
+    One SQLite row per (granularity, bucket, dimension, value), with dimension
+    "total" for the bucket total. Processes only ever add their deltas, so the
+    web server and run_ingest_worker can count into the same database, and a
+    range query reads only the buckets that exist in the range.
+    """
+
+    def __init__(self, path=ROLLUPS_DB, flush_interval=ROLLUP_FLUSH_INTERVAL_S):
+        self.path = path
+        self.flush_interval = float(flush_interval)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self._initialized = False
+        self._last_flush = 0.0
+
+    def _db(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        if not self._initialized:
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+    def is_empty(self):
+        return self._db().execute("SELECT 1 FROM rollups LIMIT 1").fetchone() is None and not self.pending
+
+    @staticmethod
+    def _add(counts, ts, label, department, city):
+        for g, (fmt, _) in GRANULARITIES.items():
+            key = bucket_start(ts, g).strftime(fmt)
+            rows = [("total", "")]
+            rows += [(dim, value or "Unknown") for dim, value in
+                     (("class", label), ("department", department), ("city", city))]
+            for dim, value in rows:
+                k = (g, key, dim, value)
+                counts[k] = counts.get(k, 0) + 1
+
+    def record(self, entry, department=None):
+        """Count one detection log entry."""
+        ts = parse_timestamp(entry.get("timestamp"))
+        if ts is None:
+            return
+        city = (entry.get("location") or {}).get("city")
+        with self.lock:
+            self._add(self.pending, ts, entry.get("class_detected"), department, city)
+            due = time.time() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def backfill(self, entries, resolve_department):
+        """Rebuild all counters from historical log entries (``resolve_department(entry)``)."""
+        counts, count = {}, 0
+        for entry in entries:
+            ts = parse_timestamp(entry.get("timestamp"))
+            if ts is None:
+                continue
+            label = entry.get("class_detected")
+            city = (entry.get("location") or {}).get("city")
+            self._add(counts, ts, label, resolve_department(entry), city)
+            count += 1
+        conn = self._db()
+        with self.lock:
+            self.pending = {}
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM rollups")
+                conn.executemany("INSERT INTO rollups VALUES (?, ?, ?, ?, ?)",
+                                 [k + (n,) for k, n in counts.items()])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def query(self, granularity, start, end, dimension=None):
+        """Return buckets in ``[start, end]`` plus summed totals.
+
+        Only buckets that have detections are read; nothing here blocks ``record``.
+        """
+        fmt, _ = GRANULARITIES[granularity]
+        dims = ("total",) + ((dimension,) if dimension else DIMENSIONS)
+        rows = self._db().execute(
+            "SELECT bucket, dimension, value, n FROM rollups WHERE granularity = ? AND bucket BETWEEN ? AND ? "
+            "AND dimension IN ({}) ORDER BY bucket".format(",".join("?" * len(dims))),
+            (granularity, bucket_start(start, granularity).strftime(fmt), end.strftime(fmt)) + dims,
+        ).fetchall()
+        with self.lock:
+            pending = [(k[1], k[2], k[3], n) for k, n in self.pending.items() if k[0] == granularity]
+        lo, hi = bucket_start(start, granularity).strftime(fmt), end.strftime(fmt)
+        rows += [r for r in pending if lo <= r[0] <= hi and r[1] in dims]
+
+        by_bucket = {}
+        totals = {"total": 0}
+        for bucket, dim, value, n in rows:
+            row = by_bucket.get(bucket)
+            if row is None:
+                row = {"bucket": bucket, "total": 0}
+                row.update((d, {}) for d in dims[1:])
+                by_bucket[bucket] = row
+            if dim == "total":
+                row["total"] += n
+                totals["total"] += n
+            else:
+                row[dim][value] = row[dim].get(value, 0) + n
+                acc = totals.setdefault(dim, {})
+                acc[value] = acc.get(value, 0) + n
+        series = [by_bucket[k] for k in sorted(by_bucket)]
+        return {"granularity": granularity, "buckets": series, "totals": totals}
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self._last_flush = time.time()
+        if not pending:
+            return
+        try:
+            conn = self._db()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO rollups VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (granularity, bucket, dimension, value) DO UPDATE SET n = n + excluded.n",
+                    [k + (n,) for k, n in pending.items()],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print(f"Error writing rollups to '{self.path}':", e)
+            # Keep the counts for the next flush
+            with self.lock:
+                for k, n in pending.items():
+                    self.pending[k] = self.pending.get(k, 0) + n
+
+
+rollup_store = RollupStore()
+atexit.register(rollup_store.flush)
@@ -0,0 +1,150 @@
+import json
+import os
+
+import numpy as np
+from django.conf import settings
+
+from .metrics import metrics
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTING_FILE = getattr(settings, "CIVICX_ROUTING_FILE", os.path.join(BASE_DIR, "routing.json"))
+
+UNASSIGNED = "Unassigned"
+
+# Used when no routing file is present; keys are matched after _normalize_label
+CATEGORY_TO_DEPARTMENT = {
+    "garbage": "Sanitation",
+    "pothole": "PWD",
+    "road crack": "PWD",
+    "broken streetlight": "Electrical",
+    "water leakage": "WaterDept",
+    "drain blockage": "DrainageDept",
+}
+
+
+def _normalize_label(label):
+    if not label:
+        return None
+    key = label.strip().lower().replace('_', ' ')
+    key = ' '.join(key.split())
+    return key
+
+
+class RoutingTable:
+    """Label -> department rules loaded from routing.json.
+
+    File format::
+
+        {
+            "default_department": "Unassigned",
+            "min_confidence": 0.5,
+            "routes": {
+                "Garbage": "Sanitation",
+                "Potholes and RoadCracks": {"department": "PWD", "min_confidence": 0.4}
+            }
+        }
+    """
+
+    def __init__(self, routes=None, default_department=UNASSIGNED, min_confidence=0.0):
+        self.default_department = default_department
+        self.min_confidence = float(min_confidence)
+        self.routes = {}
+        for label, rule in (routes or {}).items():
+            if isinstance(rule, str):
+                rule = {"department": rule}
+            self.routes[_normalize_label(label)] = {
+                "department": rule["department"],
+                "min_confidence": float(rule.get("min_confidence", self.min_confidence)),
+            }
+
+    @classmethod
+    def load(cls, path=ROUTING_FILE):
+        if not os.path.exists(path):
+            print(f"Warning: routing file '{path}' not found. Using built-in CATEGORY_TO_DEPARTMENT.")
+            return cls(CATEGORY_TO_DEPARTMENT)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            data.get("routes", {}),
+            default_department=data.get("default_department", UNASSIGNED),
+            min_confidence=data.get("min_confidence", 0.0),
+        )
+
+    def department_for_name(self, label, confidence=None):
+        """Slow path for labels that are not model outputs (e.g. historical log entries).
+
+        Applies the same confidence threshold as live routing when ``confidence`` is known.
+        """
+        rule = self.routes.get(_normalize_label(label))
+        if rule is None:
+            return self.default_department
+        if confidence is not None and confidence < rule["min_confidence"]:
+            return self.default_department
+        return rule["department"]
+
+    def department_for_entry(self, entry):
+        """Department of a detection log entry: the one routed live if it was recorded."""
+        if entry.get("department"):
+            return entry["department"]
+        return self.department_for_name(entry.get("class_detected"), entry.get("confidence"))
+
+    def compile(self, names):
+        """Build a class-index lookup for a model's ``names`` ({idx: label})."""
+        return CompiledRoutes(self, names)
+
+
+class CompiledRoutes:
+    """Per-model routing arrays so routing a prediction is a single index."""
+
+    def __init__(self, table, names):
+        if isinstance(names, dict):
+            size = max(names) + 1 if names else 0
+            labels = [names.get(i, str(i)) for i in range(size)]
+        else:
+            labels = list(names)
+
+        self.labels = labels
+        self.default_department = table.default_department
+        self.departments = []
+        self.thresholds = np.zeros(len(labels), dtype=np.float32)
+        self.mapped = np.zeros(len(labels), dtype=bool)
+        for idx, label in enumerate(labels):
+            rule = table.routes.get(_normalize_label(label))
+            if rule is None:
+                self.departments.append(table.default_department)
+                self.thresholds[idx] = table.min_confidence
+            else:
+                self.departments.append(rule["department"])
+                self.thresholds[idx] = rule["min_confidence"]
+                self.mapped[idx] = True
+
+        unmapped = [labels[i] for i in range(len(labels)) if not self.mapped[i]]
+        if unmapped and len(unmapped) <= 20:
+            print(f"Warning: no route for model classes {unmapped}; they go to '{table.default_department}'.")
+        elif unmapped:
+            print(f"Warning: {len(unmapped)} of {len(labels)} model classes have no route.")
+        metrics.set("routing_unmapped_classes", len(unmapped))
+        # Per-class counters below are keyed by class index; this maps them back to labels
+        metrics.set("routing_class_labels", dict(enumerate(labels)))
+
+    def route(self, top_idx, confidence):
+        """Return (department, reason) where reason is routed/low_confidence/unmapped."""
+        if top_idx is None or not 0 <= top_idx < len(self.departments):
+            metrics.incr("routing_unassigned", "no_prediction")
+            return self.default_department, "no_prediction"
+
+        if not self.mapped[top_idx]:
+            metrics.incr("routing_unassigned", "unmapped")
+            metrics.incr("routing_unmapped_predictions", top_idx)
+            return self.default_department, "unmapped"
+
+        if confidence is not None and confidence < self.thresholds[top_idx]:
+            metrics.incr("routing_unassigned", "low_confidence")
+            metrics.incr("routing_low_confidence", top_idx)
+            return self.default_department, "low_confidence"
+
+        metrics.incr("routing_routed", top_idx)
+        return self.departments[top_idx], "routed"
+
+
+routing_table = RoutingTable.load()
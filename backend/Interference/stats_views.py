@@ -0,0 +1,78 @@
+import datetime
+
+from django.http import JsonResponse
+
+from .camera import camera_broker
+from .detection_log import detection_log
+from .ingest_queue import ingest_queue
+from .metrics import metrics
+from .rollups import rollup_store, GRANULARITIES, DIMENSIONS, parse_timestamp
+
+# Longest range /stats/ answers, in buckets (a year of hours, ~24 years of days)
+MAX_STATS_BUCKETS = 24 * 366
+
+
+def detection_stats(request):
+    """Detection counts per hour/day bucket from the precomputed rollups.
+
+    GET params: granularity (hour|day, default day), start/end (ISO datetime,
+    default last 7 days), dimension (class|department|city, default all)
+    """
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return JsonResponse({'error': f'granularity must be one of {sorted(GRANULARITIES)}'}, status=400)
+
+    dimension = request.GET.get('dimension')
+    if dimension and dimension not in DIMENSIONS:
+        return JsonResponse({'error': f'dimension must be one of {list(DIMENSIONS)}'}, status=400)
+
+    end = parse_timestamp(request.GET['end']) if request.GET.get('end') else datetime.datetime.now()
+    start = parse_timestamp(request.GET['start']) if request.GET.get('start') else end - datetime.timedelta(days=7)
+    if start is None or end is None:
+        return JsonResponse({'error': 'start/end must be ISO datetimes'}, status=400)
+    if start > end:
+        return JsonResponse({'error': 'start must be before end'}, status=400)
+    if (end - start) / GRANULARITIES[granularity][1] > MAX_STATS_BUCKETS:
+        return JsonResponse({'error': f'range too long: at most {MAX_STATS_BUCKETS} {granularity} buckets'},
+                            status=400)
+
+    return JsonResponse(rollup_store.query(granularity, start, end, dimension))
+
+
+def detection_history(request):
+    """Raw detection records in a time range, read from the log segments that cover it.
+
+    GET params: start/end (ISO datetime, default last 24 hours), limit (default 1000, max 10000)
+    """
+    end = parse_timestamp(request.GET['end']) if request.GET.get('end') else datetime.datetime.now()
+    start = parse_timestamp(request.GET['start']) if request.GET.get('start') else end - datetime.timedelta(days=1)
+    if start is None or end is None:
+        return JsonResponse({'error': 'start/end must be ISO datetimes'}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', 1000)), 10000)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    if limit <= 0:
+        return JsonResponse({'error': 'limit must be positive'}, status=400)
+
+    detections = []
+    with detection_log.locked():
+        for entry in detection_log.iter_range(start.timestamp(), end.timestamp()):
+            detections.append(entry)
+            if len(detections) >= limit:
+                break
+    return JsonResponse({'detections': detections, 'truncated': len(detections) >= limit})
+
+
+def runtime_metrics(request):
+    """Process-local counters and timings (routing outcomes, inference latency, ...)."""
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    if counters.get("cascade_requests"):
+        counters["cascade_escalation_rate"] = counters.get("cascade_escalated", 0) / counters["cascade_requests"]
+    try:
+        snapshot["ingest_queue"] = ingest_queue.counts()
+    except Exception as e:
+        snapshot["ingest_queue"] = {"error": str(e)}
+    snapshot["cameras"] = camera_broker.status()
+    return JsonResponse(snapshot)
@@ -1,3 +1,163 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.test import SimpleTestCase
+
+from .camera import CameraSource, CameraUnavailable
+from .metrics import metrics
+from .routing import RoutingTable, UNASSIGNED
+from .upload_guard import sniff_image
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+# ---------------------- CAMERA ----------------------
+class CameraSourceTests(SimpleTestCase):
+    """CameraSource against a generated video file standing in for a device."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        cls.video = os.path.join(cls.tmp, "fake_camera.avi")
+        writer = cv2.VideoWriter(cls.video, cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+        for i in range(30):
+            frame = np.full((48, 64, 3), i * 8, dtype=np.uint8)
+            writer.write(frame)
+        writer.release()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def _camera(self, idle_release_s=0.2):
+        cam = CameraSource(self.video, idle_release_s=idle_release_s)
+        self.addCleanup(self._stop, cam)
+        return cam
+
+    def _stop(self, cam):
+        with cam.lock:
+            cam.consumers = 0
+            cam.idle_release_s = 0.0
+        _wait_until(lambda: cam.thread is None)
+
+    def _snapshot_counts(self):
+        return dict(metrics.snapshot()["counters"].get("camera_snapshots", {}))
+
+    def test_snapshot_opens_device_then_serves_from_memory(self):
+        cam = self._camera(idle_release_s=5.0)
+        before = self._snapshot_counts()
+
+        frame = cam.snapshot()
+        self.assertIsNotNone(frame)
+        self.assertEqual(frame.shape, (48, 64, 3))
+        self.assertFalse(frame.flags.writeable)
+        self.assertTrue(cam.running)
+
+        self.assertIsNotNone(cam.snapshot(max_age=5.0))
+        after = self._snapshot_counts()
+        self.assertEqual(after.get("waited", 0) - before.get("waited", 0), 1)
+        self.assertEqual(after.get("memory", 0) - before.get("memory", 0), 1)
+
+    def test_acquire_release_refcount(self):
+        cam = self._camera(idle_release_s=0.1)
+        cam.acquire()
+        cam.acquire()
+        self.assertEqual(cam.consumers, 2)
+        self.assertIsNotNone(cam.wait_frame())
+
+        cam.release()
+        self.assertEqual(cam.consumers, 1)
+        time.sleep(0.3)
+        self.assertTrue(cam.running, "device released while a consumer still holds it")
+
+        cam.release()
+        cam.release()  # extra releases never go negative
+        self.assertEqual(cam.consumers, 0)
+
+    def test_idle_release_and_reopen(self):
+        cam = self._camera(idle_release_s=0.2)
+        with cam:
+            self.assertIsNotNone(cam.wait_frame())
+        self.assertTrue(_wait_until(lambda: cam.thread is None), "device was not released when idle")
+        self.assertIsNone(cam.latest)
+        self.assertFalse(cam.running)
+
+        # The next snapshot reopens the device
+        self.assertIsNotNone(cam.snapshot())
+        self.assertTrue(cam.running)
+
+    def test_missing_source_file(self):
+        cam = CameraSource(os.path.join(self.tmp, "missing.avi"))
+        with self.assertRaises(CameraUnavailable):
+            cam.snapshot()
+
+
+# ---------------------- UPLOAD GUARD ----------------------
+class SniffImageTests(SimpleTestCase):
+    def _encode(self, ext, width, height):
+        ok, buf = cv2.imencode(ext, np.zeros((height, width, 3), dtype=np.uint8))
+        self.assertTrue(ok)
+        return buf.tobytes()
+
+    def test_formats_and_dimensions(self):
+        self.assertEqual(sniff_image(self._encode(".jpg", 120, 80)), ("jpeg", (120, 80)))
+        self.assertEqual(sniff_image(self._encode(".png", 33, 640)), ("png", (33, 640)))
+        self.assertEqual(sniff_image(self._encode(".webp", 200, 150)), ("webp", (200, 150)))
+
+    def test_header_prefix_is_enough(self):
+        self.assertEqual(sniff_image(self._encode(".png", 300, 200)[:64]), ("png", (300, 200)))
+
+    def test_truncated_header(self):
+        self.assertEqual(sniff_image(self._encode(".png", 300, 200)[:16]), ("png", None))
+
+    def test_unknown_format(self):
+        self.assertEqual(sniff_image(b"GIF89a" + b"\x00" * 64), (None, None))
+        self.assertEqual(sniff_image(b""), (None, None))
+
+
+# ---------------------- ROUTING ----------------------
+class RoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.table = RoutingTable(
+            {"Garbage": "Sanitation", "Potholes and RoadCracks": {"department": "PWD", "min_confidence": 0.4}},
+            min_confidence=0.5,
+        )
+        self.routes = self.table.compile({0: "Garbage", 1: "Potholes_and_RoadCracks", 2: "Graffiti"})
+
+    def test_route(self):
+        self.assertEqual(self.routes.route(0, 0.9), ("Sanitation", "routed"))
+        self.assertEqual(self.routes.route(1, 0.45), ("PWD", "routed"))
+
+    def test_thresholds(self):
+        self.assertEqual(self.routes.route(0, 0.45), (UNASSIGNED, "low_confidence"))
+        self.assertEqual(self.routes.route(1, 0.3), (UNASSIGNED, "low_confidence"))
+
+    def test_unmapped_and_missing_predictions(self):
+        self.assertEqual(self.routes.route(2, 0.99), (UNASSIGNED, "unmapped"))
+        self.assertEqual(self.routes.route(None, None), (UNASSIGNED, "no_prediction"))
+        self.assertEqual(self.routes.route(7, 0.9), (UNASSIGNED, "no_prediction"))
+
+    def test_compiled_routes_match_name_lookup(self):
+        for idx, label in enumerate(self.routes.labels):
+            for confidence in (0.3, 0.45, 0.9):
+                self.assertEqual(self.routes.route(idx, confidence)[0],
+                                 self.table.department_for_name(label, confidence))
+
+    def test_department_for_entry_prefers_live_routing(self):
+        entry = {"class_detected": "garbage", "confidence": 0.9, "department": "Unassigned"}
+        self.assertEqual(self.table.department_for_entry(entry), "Unassigned")
+        del entry["department"]
+        self.assertEqual(self.table.department_for_entry(entry), "Sanitation")
@@ -0,0 +1,158 @@
+import struct
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .metrics import metrics
+
+# ---------------------- UPLOAD LIMITS ----------------------
+MAX_UPLOAD_BYTES = getattr(settings, "CIVICX_MAX_UPLOAD_BYTES", 10 * 1024 * 1024)
+MAX_IMAGE_PIXELS = getattr(settings, "CIVICX_MAX_IMAGE_PIXELS", 40_000_000)
+MIN_IMAGE_SIDE = getattr(settings, "CIVICX_MIN_IMAGE_SIDE", 32)
+# JPEGs are decoded at 1/2, 1/4 or 1/8 scale as long as the short side stays
+# above this; the classifier only sees 224px anyway.
+MIN_DECODE_SIDE = getattr(settings, "CIVICX_MIN_DECODE_SIDE", 448)
+
+HEADER_BYTES = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadRejected(Exception):
+    def __init__(self, reason, message, status=400):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.status = status
+        metrics.incr("upload_rejected", reason)
+
+
+# ---------------------- HEADER SNIFFING ----------------------
+def _png_size(head):
+    if len(head) < 24 or head[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", head[16:24])
+    return width, height
+
+
+def _jpeg_size(head):
+    # Walk the marker segments until a start-of-frame marker carries the size
+    i = 2
+    while i + 9 < len(head):
+        if head[i] != 0xFF:
+            return None
+        marker = head[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = struct.unpack(">H", head[i + 2:i + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", head[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def _webp_size(head):
+    if len(head) < 30:
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        width = 1 + int.from_bytes(head[24:27], "little")
+        height = 1 + int.from_bytes(head[27:30], "little")
+        return width, height
+    if chunk == b"VP8L":
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    return None
+
+
+def sniff_image(head):
+    """Return (format, (width, height) or None) from the first bytes of a file."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg", _jpeg_size(head)
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png", _png_size(head)
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", _webp_size(head)
+    return None, None
+
+
+# ---------------------- GUARD ----------------------
+def check_content_length(request):
+    """Reject oversized request bodies before Django parses the multipart upload."""
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    if length > MAX_UPLOAD_BYTES + CHUNK_SIZE:
+        raise UploadRejected("too_large", f"Upload exceeds {MAX_UPLOAD_BYTES} bytes", status=413)
+
+
+def read_upload(img_file):
+    """Validate an uploaded image and return (bytes, info).
+
+    The header is checked for format and dimensions first; the rest of the file is
+    only read if it passes, and reading stops as soon as the size cap is exceeded.
+    """
+    size = getattr(img_file, "size", None)
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        raise UploadRejected("too_large", f"Upload exceeds {MAX_UPLOAD_BYTES} bytes", status=413)
+    if size == 0:
+        raise UploadRejected("empty", "Uploaded file is empty")
+
+    buf = bytearray()
+    info = None
+    header_checked = False
+    for chunk in img_file.chunks(CHUNK_SIZE):
+        buf.extend(chunk)
+        if len(buf) > MAX_UPLOAD_BYTES:
+            raise UploadRejected("too_large", f"Upload exceeds {MAX_UPLOAD_BYTES} bytes", status=413)
+        if not header_checked and len(buf) >= HEADER_BYTES:
+            header_checked = True
+            info = _check_header(bytes(buf[:HEADER_BYTES]), complete=False)
+
+    if not buf:
+        raise UploadRejected("empty", "Uploaded file is empty")
+    if info is None:
+        # Small file, or a JPEG whose frame header sits behind large metadata
+        info = _check_header(bytes(buf), complete=True)
+    return bytes(buf), info
+
+
+def _check_header(head, complete):
+    fmt, dims = sniff_image(head)
+    if fmt is None:
+        raise UploadRejected("unsupported_format", "Only JPEG, PNG and WebP images are accepted", status=415)
+    if dims is None:
+        if not complete:
+            return None
+        raise UploadRejected("corrupt_header", f"Could not read {fmt.upper()} image dimensions")
+    width, height = dims
+    if min(width, height) < MIN_IMAGE_SIDE:
+        raise UploadRejected("too_small", f"Image must be at least {MIN_IMAGE_SIDE}px on each side")
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadRejected("too_many_pixels", f"Image exceeds {MAX_IMAGE_PIXELS} pixels", status=413)
+    return {"format": fmt, "width": width, "height": height}
+
+
+def decode_upload(data, info):
+    """Decode validated bytes, using libjpeg's reduced-size decode for big JPEGs."""
+    flag = cv2.IMREAD_COLOR
+    if info["format"] == "jpeg":
+        short_side = min(info["width"], info["height"])
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if short_side // factor >= MIN_DECODE_SIDE:
+                flag = reduced
+                break
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if img is None:
+        metrics.incr("upload_rejected", "decode_failed")
+    return img
@@ -1,17 +1,26 @@
 from django.urls import path
 from . import views
 from . import geocoding_views
+from . import stats_views
+from . import model_views
 
 urlpatterns = [
     path("classify-image/", views.classify_image),
     path("classify_image/", views.classify_image),
     path("reportIssue/", views.report_issue),
+    path("reports/<str:job_id>/", views.report_status),
     path("capture-now/", views.capture_now),
     path("start-webcam/", views.start_webcam),
     path("stop-webcam/", views.stop_webcam),
     path("previews/", views.list_previews),
     path("preview/<str:filename>", views.preview_image),
     path("latest-detection/", views.latest_detection),
+    path("stats/", stats_views.detection_stats),
+    path("metrics/", stats_views.runtime_metrics),
+    path("detections/", stats_views.detection_history),
+    path("models/", model_views.model_status),
+    path("models/load/", model_views.load_model),
+    path("models/rollback/", model_views.rollback_model),
     path("reverse-geocode/", geocoding_views.reverse_geocode),
     path("geocode/", geocoding_views.geocode),
 ]
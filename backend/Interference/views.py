@@ -1,40 +1,49 @@
 import cv2
-import json
 import datetime
 import threading
 import requests
-import numpy as np
 import os
 import time
+from django.conf import settings
 from django.http import JsonResponse, HttpResponse, FileResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from ultralytics import YOLO
+from .camera import camera_broker, CameraUnavailable
+from .dedup import incident_index, extract_embedding
+from .detection_log import detection_log, LOG_FILE
+from .rollups import rollup_store
+from .routing import routing_table
+from .model_manager import model_manager, ModelUnavailable, default_weights
+from .inference_pool import InferencePoolClient, POOL_ADDRESS as INFERENCE_POOL_ADDRESS
+from .ingest_queue import ingest_queue, INGEST_ASYNC
+from .upload_guard import UploadRejected, check_content_length, read_upload, decode_upload
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # ---------------------- MODEL PATH ----------------------
-# Try multiple possible model paths
-MODEL_PATHS = [
-    r"D:/CivicX-Final/CivicX-1/backend/runs/classify/civicx_cls_model6/weights/best.pt",
-    os.path.join(BASE_DIR, "runs", "classify", "civicx_cls_model6", "weights", "best.pt"),
-    os.path.join(BASE_DIR, "models", "best.pt"),
-    "yolov8n-cls.pt"  # fallback to default YOLOv8 classification model
-]
-
-MODEL_PATH = None
-for path in MODEL_PATHS:
-    if os.path.exists(path):
-        MODEL_PATH = path
-        break
-
-if MODEL_PATH is None:
-    print("Warning: No model file found. Using default YOLOv8 classification model.")
-    MODEL_PATH = "yolov8n-cls.pt"  # This will auto-download if not present
-
-print(f"Loading model from: {MODEL_PATH}")
-model = YOLO(MODEL_PATH)
-LOG_FILE = os.path.join(BASE_DIR, "detections_log.json")
+# First existing entry of model_manager.MODEL_PATHS (shared with run_inference_pool)
+MODEL_PATH = default_weights()
+
+# Optional small first-stage model (same classes, e.g. train.py with yolov8n-cls.pt);
+# the main model above only runs when the small one is unsure.
+CASCADE_SMALL_MODEL_PATH = getattr(settings, "CIVICX_CASCADE_SMALL_MODEL", None)
+if CASCADE_SMALL_MODEL_PATH and not os.path.exists(CASCADE_SMALL_MODEL_PATH):
+    print(f"Warning: cascade small model '{CASCADE_SMALL_MODEL_PATH}' not found. Cascade disabled.")
+    CASCADE_SMALL_MODEL_PATH = None
+
+# The active model (plus its cascade and compiled routes) lives in the model manager
+# so new weights can be swapped in at runtime; see model_views.py. With an inference
+# pool configured the weights live in the pool's processes instead of this one.
+if INFERENCE_POOL_ADDRESS:
+    print(f"Using inference pool at {INFERENCE_POOL_ADDRESS}")
+    try:
+        model_manager.attach_pool(InferencePoolClient(INFERENCE_POOL_ADDRESS))
+    except RuntimeError as e:
+        # Misconfigured (e.g. remote address without a secret): keep the other endpoints up
+        print("Error: inference pool disabled:", e)
+else:
+    model_manager.load_sync(MODEL_PATH, CASCADE_SMALL_MODEL_PATH)
+
 PREVIEWS_DIR = os.path.join(BASE_DIR, "previews")
 
 # Thread control
@@ -63,44 +72,39 @@ def get_location():
 
 
 # ---------------------- SAVE DETECTION ----------------------
-def save_detection(predicted_class):
-    location = get_location()
-
-    entry = {
-        "timestamp": str(datetime.datetime.now()),
-        "class_detected": predicted_class,
-        "location": location
-    }
-
-    # Ensure log file exists with a JSON array; handle empty/corrupt files gracefully
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "w", encoding="utf-8") as f:
-            json.dump([], f, indent=4)
-
-    try:
-        with open(LOG_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if not isinstance(data, list):
-                # If the file contains a JSON object or other type, reset to list
-                data = []
-    except (json.JSONDecodeError, ValueError):
-        # Empty or malformed JSON — reinitialize the log
-        print(f"Warning: '{LOG_FILE}' is empty or malformed. Reinitializing log file.")
-        data = []
-    except Exception as e:
-        # Any other file error — print and fallback to empty list
-        print(f"Error reading log file '{LOG_FILE}':", e)
-        data = []
+def save_detection(predicted_class, location=None, department=None, model_version=None):
+    save_detections([(predicted_class, location, department, model_version)])
+
+
+def save_detections(detections):
+    """Append several (predicted_class, location, department, model_version) records
+    to the log with a single read/write of the file."""
+    entries = []
+    for predicted_class, location, department, model_version in detections:
+        if location is None:
+            location = get_location()
+        if department is None:
+            department = routing_table.department_for_name(predicted_class)
+        entry = {
+            "timestamp": str(datetime.datetime.now()),
+            "class_detected": predicted_class,
+            "location": location,
+            "model_version": model_version or model_manager.current().version,
+            # Routed department as decided live (confidence thresholds included),
+            # so backfills and exports agree with what the report got
+            "department": department,
+        }
+        entries.append((entry, department))
+    if not entries:
+        return
 
-    data.append(entry)
+    # Appends go to the small active file; older history lives in compressed
+    # segments (see detection_log.py), so this cost does not grow with history
+    detection_log.append([entry for entry, _ in entries])
 
-    try:
-        with open(LOG_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4)
-    except Exception as e:
-        print(f"Error writing to log file '{LOG_FILE}':", e)
-
-    print("✔ Saved detection:", entry)
+    for entry, department in entries:
+        rollup_store.record(entry, department)
+        print("✔ Saved detection:", entry)
 
 
 def _save_preview_image(frame):
@@ -128,194 +132,315 @@ def apply_sketch(frame):
     return output
 
 
+def _rejected(e):
+    print(f"upload rejected ({e.reason}):", e.message)
+    return JsonResponse({"error": e.message, "reason": e.reason}, status=e.status)
+
+
 # ---------------------- STATIC IMAGE CLASSIFICATION ----------------------
 @csrf_exempt
 def classify_image(request):
     if request.method != "POST":
         return JsonResponse({"error": "Send POST request with image."})
 
-    img_file = request.FILES.get("image")
-    if not img_file:
-        return JsonResponse({"error": "No image uploaded."})
+    # Size/format/dimension checks happen before the full upload is read or decoded
+    try:
+        check_content_length(request)
+        img_file = request.FILES.get("image")
+        if not img_file:
+            return JsonResponse({"error": "No image uploaded."})
+        data, info = read_upload(img_file)
+    except UploadRejected as e:
+        return _rejected(e)
 
     # Convert Uploaded file to OpenCV image
-    file_bytes = np.asarray(bytearray(img_file.read()), dtype=np.uint8)
-    img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+    img = decode_upload(data, info)
     if img is None:
         # decoding failed
         print("classify_image: failed to decode uploaded image")
         return JsonResponse({"error": "Could not decode image"}, status=400)
 
+    # One model version for the whole request, even if a swap happens meanwhile
+    try:
+        mv = model_manager.current()
+    except ModelUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
     try:
-        results = model(img)
+        prediction = mv.classifier.classify(img)
     except Exception as e:
         print("classify_image: model inference error:", e)
         return JsonResponse({"error": "Model inference failed"}, status=500)
-    # Attempt to extract label and confidence safely
-    try:
-        res0 = results[0]
-        probs = getattr(res0, 'probs', None)
-        if probs is not None:
-            # probs may be a numpy array or an object with top1
-            if isinstance(probs, (list, tuple)) or hasattr(probs, 'tolist'):
-                probs_arr = np.array(probs)
-                top_idx = int(np.argmax(probs_arr))
-                confidence = float(probs_arr[top_idx])
-            else:
-                # object with top1 attribute
-                top_idx = int(getattr(probs, 'top1', 0))
-                confidence = float(probs[top_idx])
-        else:
-            # If probs not available, fallback to top1 if present
-            top_idx = getattr(res0, 'probs', None)
-            confidence = None
-
-        pred = res0.names[top_idx] if res0 and top_idx is not None else None
-    except Exception:
-        pred = None
-        confidence = None
+
+    pred = prediction["label"] if prediction else None
+    confidence = prediction["confidence"] if prediction else None
 
     if pred:
-        save_detection(pred)
+        # Same compiled routing (and confidence threshold) as reportIssue
+        department, _ = mv.routes.route(prediction["top_idx"], confidence)
+        save_detection(pred, department=department, model_version=mv.version)
 
     return JsonResponse({
         "status": "success",
         "predicted_class": pred,
-        "confidence": float(confidence) if confidence is not None else None
+        "confidence": float(confidence) if confidence is not None else None,
+        "model_version": mv.version,
     })
 
 
 @csrf_exempt
 def latest_detection(request):
-    """Return the most recent detection record from the JSON log file."""
+    """Return the most recent detection record from the detection log."""
     try:
-        if not os.path.exists(LOG_FILE):
-            return JsonResponse({"latest": None})
-
-        with open(LOG_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            if not isinstance(data, list) or len(data) == 0:
-                return JsonResponse({"latest": None})
-            latest = data[-1]
-            return JsonResponse({"latest": latest})
+        return JsonResponse({"latest": detection_log.latest()})
     except Exception as e:
         print("latest_detection error:", e)
         return JsonResponse({"error": "Could not fetch latest detection"}, status=500)
 
 
 # ---------------------- AUTO-ROUTE REPORT ENDPOINT ----------------------
-# Map predicted categories to municipal departments (case-insensitive)
-CATEGORY_TO_DEPARTMENT = {
-    "garbage": "Sanitation",
-    "pothole": "PWD",
-    "road crack": "PWD",
-    "broken streetlight": "Electrical",
-    "water leakage": "WaterDept",
-    "drain blockage": "DrainageDept",
-}
-
-
-def _normalize_label(label):
+# Department routing rules live in routing.json (see routing.py); each model version
+# compiles them against its class names once so routing is an array lookup.
+
+
+# Seed the rollups from the historical log the first time they are used
+# (re-run any time with `python manage.py backfill_stats`)
+if rollup_store.is_empty() and os.path.exists(LOG_FILE):
+    try:
+        with detection_log.locked():
+            rollup_store.backfill(detection_log.iter_all(), routing_table.department_for_entry)
+    except Exception as e:
+        print("rollup backfill error:", e)
+
+# Rotate, compact and expire the detection log in the background
+detection_log.start_background()
+
+
+def _report_location(lat=None, lon=None):
+    location = get_location()
+    if lat and lon:
+        location = dict(location, lat=lat, lon=lon)
+    return location
+
+
+def _client_coords(data):
+    """lat/lon (or lng) sent with a report, or (None, None)."""
+    lat = data.get('lat')
+    lon = data.get('lon') or data.get('lng')
+    return (lat, lon) if lat and lon else (None, None)
+
+
+def _route_report(mv, img, prediction, location_fn, coords=(None, None)):
+    """Route one classified report and group it into an incident.
+
+    Returns (response dict, detection tuple for save_detections or None). The
+    location is only resolved (``location_fn()``) when the image was classified.
+    Only client-supplied ``coords`` are used for clustering: the IP fallback is
+    the server's own location and would merge every report into one incident.
+    """
+    top_idx = prediction["top_idx"] if prediction else None
+    confidence = prediction["confidence"] if prediction else None
+    label = prediction["label"] if prediction else None
+
+    # Map to department
+    assigned_department, route_reason = mv.routes.route(top_idx if label else None, confidence)
+
+    # Group into an existing open incident when the same issue was already reported nearby
+    incident = None
+    is_duplicate = False
+    detection = None
+    if label:
+        location = location_fn()
+        incident, is_duplicate = incident_index.match_or_create(
+            label, coords[0], coords[1], assigned_department,
+            embedding=extract_embedding(mv.model, img), model_version=mv.version,
+        )
+
+        detection = (label, location, assigned_department, mv.version)
+        # Duplicates are already routed; skip the extra preview to save storage
+        if not is_duplicate:
+            try:
+                _save_preview_image(img)
+            except Exception:
+                pass
+
     if not label:
-        return None
-    key = label.strip().lower().replace('_', ' ')
-    key = ' '.join(key.split())
-    return key
+        status = "Could not classify"
+    elif is_duplicate:
+        status = "Merged"
+    elif route_reason == "low_confidence":
+        status = "Needs Review"
+    else:
+        status = "Auto-Routed"
+
+    return {
+        "issue_type": str(label) if label else None,
+        "assigned_department": assigned_department,
+        "confidence": float(confidence) if confidence is not None else None,
+        "status": status,
+        "incident_id": incident["incident_id"] if incident else None,
+        "duplicate": is_duplicate,
+        "model_version": mv.version,
+    }, detection
 
 
 @csrf_exempt
 def report_issue(request):
     """Endpoint to accept an uploaded image, classify it, auto-assign to department, and return structured JSON.
-    POST fields: image
-    Returns: JSON {issue_type, assigned_department, confidence, status}
+    POST fields: image, optional lat/lon or lat/lng (falls back to the server's IP location,
+    which is recorded but never used to merge reports into incidents),
+    optional mode=async|sync (default from CIVICX_INGEST_ASYNC)
+    Returns: JSON {issue_type, assigned_department, confidence, status, incident_id, duplicate, model_version}
+    or, when queued, 202 {job_id, status, status_url}
     """
     if request.method != 'POST':
         return JsonResponse({"error": "Send POST request with image."}, status=400)
 
-    img_file = request.FILES.get('image')
-    if not img_file:
-        return JsonResponse({"error": "No image uploaded."}, status=400)
+    try:
+        check_content_length(request)
+        img_file = request.FILES.get('image')
+        if not img_file:
+            return JsonResponse({"error": "No image uploaded."}, status=400)
+        data, info = read_upload(img_file)
+    except UploadRejected as e:
+        return _rejected(e)
+
+    lat, lon = _client_coords(request.POST)
+
+    # Async mode: persist the upload and let `manage.py run_ingest_worker` classify it
+    mode = request.POST.get('mode') or request.GET.get('mode')
+    if mode == 'async' or (INGEST_ASYNC and mode != 'sync'):
+        try:
+            job_id = ingest_queue.enqueue(data, info, lat, lon)
+        except Exception as e:
+            print('report_issue enqueue error:', e)
+            return JsonResponse({"error": "Could not queue report"}, status=503)
+        return JsonResponse({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": request.build_absolute_uri(f"/Interference/reports/{job_id}/"),
+        }, status=202)
 
     try:
         # Convert to OpenCV image
-        file_bytes = np.asarray(bytearray(img_file.read()), dtype=np.uint8)
-        img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+        img = decode_upload(data, info)
         if img is None:
-            raise ValueError("Image decode failed")
+            return JsonResponse({"error": "Could not decode image"}, status=400)
 
-        # Predict using existing model
-        results = model(img)
-        res0 = results[0]
+        # Predict (small model first when the cascade is enabled)
+        mv = model_manager.current()
+        prediction = mv.classifier.classify(img)
 
-        # Extract label and confidence robustly
-        try:
-            probs = getattr(res0, 'probs', None)
-            if probs is not None:
-                if isinstance(probs, (list, tuple)) or hasattr(probs, 'tolist'):
-                    probs_arr = np.array(probs)
-                    top_idx = int(np.argmax(probs_arr))
-                    confidence = float(probs_arr[top_idx])
-                else:
-                    top_idx = int(getattr(probs, 'top1', 0))
-                    confidence = float(probs[top_idx])
-            else:
-                top_idx = None
-                confidence = None
-        except Exception:
-            top_idx = None
-            confidence = None
+        response, detection = _route_report(mv, img, prediction, lambda: _report_location(lat, lon), (lat, lon))
+        if detection:
+            save_detection(*detection)
+        return JsonResponse(response)
 
-        label = res0.names[top_idx] if (res0 and top_idx is not None) else None
+    except ModelUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except Exception as e:
+        print('report_issue error:', e)
+        return JsonResponse({"error": "Internal server error"}, status=500)
 
-        # Save detection and preview if label found
-        if label:
-            save_detection(label)
-            try:
-                _save_preview_image(img)
-            except Exception:
-                pass
 
-        # Map to department
-        assigned_department = CATEGORY_TO_DEPARTMENT.get(_normalize_label(label), 'Unassigned') if label else 'Unassigned'
+def report_status(request, job_id):
+    """Status of a queued report; includes the reportIssue result once done."""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return JsonResponse({"error": "Unknown job id"}, status=404)
+    return JsonResponse({
+        "job_id": job["id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+    })
 
-        return JsonResponse({
-            "issue_type": str(label) if label else None,
-            "assigned_department": assigned_department,
-            "confidence": float(confidence) if confidence is not None else None,
-            "status": "Auto-Routed" if label else "Could not classify",
-        })
 
-    except Exception as e:
-        print('report_issue error:', e)
-        return JsonResponse({"error": "Internal server error"}, status=500)
+def process_ingest_batch(jobs):
+    """Classify, route and save a batch of claimed ingest jobs (used by run_ingest_worker).
 
+    Bad uploads fail their own job; an inference error (e.g. the pool timing
+    out) puts the whole batch back in the queue for another attempt.
+    """
+    decoded = []
+    for job in jobs:
+        try:
+            with open(job["image_path"], "rb") as f:
+                img = decode_upload(f.read(), job["image_info"])
+            if img is None:
+                raise ValueError("Could not decode image")
+            decoded.append((job, img))
+        except Exception as e:
+            ingest_queue.fail(job["id"], e)
 
-# ---------------------- BACKGROUND THREAD FOR WEBCAM ----------------------
-def webcam_detection_thread():
-    cap = cv2.VideoCapture(0)
+    if not decoded:
+        return 0
 
-    # Check if camera was acquired successfully
-    if not cap.isOpened():
-        print("webcam_detection_thread: could not open camera (maybe it's in use by the browser)")
+    try:
+        mv = model_manager.current()
+        predictions = mv.classifier.classify_batch([img for _, img in decoded])
+    except Exception as e:
+        print("process_ingest_batch: inference failed, requeueing batch:", e)
+        for job, _ in decoded:
+            ingest_queue.retry(job["id"], e)
+        return 0
+
+    # The IP-based fallback location is looked up at most once per batch
+    fallback = []
+
+    def location_for(job):
+        if job["lat"] and job["lon"]:
+            return _report_location(job["lat"], job["lon"])
+        if not fallback:
+            fallback.append(get_location())
+        return fallback[0]
+
+    results, detections = [], []
+    for (job, img), prediction in zip(decoded, predictions):
         try:
-            cap.release()
-        except Exception:
+            response, detection = _route_report(mv, img, prediction, lambda: location_for(job),
+                                                (job["lat"], job["lon"]))
+            results.append((job, response))
+            if detection:
+                detections.append(detection)
+        except Exception as e:
+            ingest_queue.fail(job["id"], e)
+
+    save_detections(detections)
+    # Make the batch visible in /stats/ right away (the web process reads the same rollups)
+    rollup_store.flush()
+    for job, response in results:
+        ingest_queue.complete(job["id"], response)
+        try:
+            os.remove(job["image_path"])
+        except OSError:
             pass
-        return
+    return len(results)
+
 
+# ---------------------- BACKGROUND THREAD FOR WEBCAM ----------------------
+def webcam_detection_thread(cam):
+    """Classify frames from ``cam`` (already acquired by start_webcam) until stopped."""
     prev_pred = None
     start_time = None
     saved_for_this_class = False
     REQUIRED_DURATION = 3
 
     try:
+        seq = 0
         while not webcam_stop_event.is_set():
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            results = model(frame)
-            pred = results[0].names[results[0].probs.top1]
+            got = cam.wait_frame(seq, timeout=2.0)
+            if got is None:
+                if not cam.running:
+                    break
+                continue
+            frame, seq = got
+
+            mv = model_manager.current()
+            prediction = mv.classifier.classify(frame)
+            if prediction is None:
+                continue
+            pred = prediction["label"]
+            department, _ = mv.routes.route(prediction["top_idx"], prediction["confidence"])
 
             if pred != prev_pred:
                 prev_pred = pred
@@ -326,7 +451,7 @@ def webcam_detection_thread():
 
             if elapsed >= REQUIRED_DURATION and not saved_for_this_class:
                 # Save detection record
-                save_detection(pred)
+                save_detection(pred, department=department, model_version=mv.version)
                 # Save a small preview image for frontend
                 try:
                     _save_preview_image(frame)
@@ -345,10 +470,7 @@ def webcam_detection_thread():
     except Exception as e:
         print("Webcam thread error:", e)
     finally:
-        try:
-            cap.release()
-        except Exception:
-            pass
+        cam.release()
         try:
             cv2.destroyAllWindows()
         except Exception:
@@ -394,23 +516,15 @@ def preview_image(request, filename):
 
 @csrf_exempt
 def capture_now(request):
-    """Capture a single frame from the server camera (or direct VideoCapture) and save to previews."""
+    """Save the server camera's latest frame (see camera.py) to previews."""
     try:
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            try:
-                cap.release()
-            except Exception:
-                pass
-            return JsonResponse({"error": "Could not access camera"}, status=500)
-
-        ret, frame = cap.read()
+        # Served from the broker's latest frame; the device is only opened if idle
         try:
-            cap.release()
-        except Exception:
-            pass
+            frame = camera_broker.get().snapshot()
+        except CameraUnavailable as e:
+            return JsonResponse({"error": str(e)}, status=500)
 
-        if not ret or frame is None:
+        if frame is None:
             return JsonResponse({"error": "Failed to capture frame"}, status=500)
 
         fname = _save_preview_image(frame)
@@ -433,22 +547,15 @@ def start_webcam(request):
         if webcam_thread and webcam_thread.is_alive():
             return JsonResponse({"status": "already_running"})
 
-        # quick check: try opening the camera briefly to ensure it's available
-        temp_cap = cv2.VideoCapture(0)
-        if not temp_cap.isOpened():
-            try:
-                temp_cap.release()
-            except Exception:
-                pass
-            return JsonResponse({"error": "Could not access camera (maybe it's in use)"}, status=500)
+        # Register as a consumer up front so a missing/busy camera is reported here
         try:
-            temp_cap.release()
-        except Exception:
-            pass
+            cam = camera_broker.get().acquire()
+        except CameraUnavailable as e:
+            return JsonResponse({"error": str(e)}, status=500)
 
         # ensure stop event is cleared and start thread
         webcam_stop_event.clear()
-        webcam_thread = threading.Thread(target=webcam_detection_thread)
+        webcam_thread = threading.Thread(target=webcam_detection_thread, args=(cam,))
         webcam_thread.daemon = True
         webcam_thread.start()
         return JsonResponse({"status": "Webcam detection started!"})
@@ -133,3 +133,72 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# CivicX detection pipeline
+# Duplicate-report clustering (see Interference/dedup.py)
+
+CIVICX_DEDUP_RADIUS_M = 50.0
+CIVICX_DEDUP_WINDOW_HOURS = 72.0
+CIVICX_DEDUP_USE_EMBEDDINGS = False
+CIVICX_DEDUP_MIN_SIMILARITY = 0.85
+CIVICX_DEDUP_DB = os.path.join(BASE_DIR, "incidents.sqlite3")
+
+# Hourly/daily detection rollups served by /Interference/stats/ (see Interference/rollups.py)
+CIVICX_ROLLUP_FLUSH_INTERVAL_S = 5.0
+CIVICX_ROLLUPS_DB = os.path.join(BASE_DIR, "rollups.sqlite3")
+
+# Label -> department routing rules (see Interference/routing.py)
+CIVICX_ROUTING_FILE = os.path.join(BASE_DIR, "routing.json")
+
+# Confidence-gated cascade (see Interference/cascade.py). Point CIVICX_CASCADE_SMALL_MODEL
+# at small weights trained on the same classes to enable it.
+CIVICX_CASCADE_SMALL_MODEL = None
+CIVICX_CASCADE_MIN_CONFIDENCE = 0.80
+CIVICX_CASCADE_MIN_MARGIN = 0.30
+CIVICX_CASCADE_AUDIT_RATE = 0.02
+
+# Upload guard for classify-image/reportIssue (see Interference/upload_guard.py)
+CIVICX_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+CIVICX_MAX_IMAGE_PIXELS = 40_000_000
+CIVICX_MIN_IMAGE_SIDE = 32
+CIVICX_MIN_DECODE_SIDE = 448
+
+# Out-of-process inference pool (see Interference/inference_pool.py). Start it with
+# `python manage.py run_inference_pool --workers N` and set e.g. "127.0.0.1:6010".
+CIVICX_INFERENCE_POOL_ADDRESS = None
+CIVICX_INFERENCE_POOL_TIMEOUT_S = 30.0
+# Connections + shared-memory slots each Django process keeps for pool calls
+CIVICX_INFERENCE_POOL_CLIENT_SLOTS = 8
+# Required for non-loopback pool addresses; keep it out of this file
+CIVICX_INFERENCE_POOL_SECRET = os.environ.get("CIVICX_INFERENCE_POOL_SECRET")
+
+# Asynchronous report ingestion (see Interference/ingest_queue.py). Run the worker with
+# `python manage.py run_ingest_worker`; clients can also pass mode=async per request.
+CIVICX_INGEST_ASYNC = False
+CIVICX_INGEST_DB = os.path.join(BASE_DIR, "ingest_queue.sqlite3")
+CIVICX_INGEST_UPLOADS_DIR = os.path.join(BASE_DIR, "ingest_uploads")
+CIVICX_INGEST_LEASE_S = 300
+CIVICX_INGEST_MAX_ATTEMPTS = 3
+# Seconds before a job requeued after an inference error is retried (doubles per attempt)
+CIVICX_INGEST_RETRY_BACKOFF_S = 5.0
+
+# Detection log lifecycle (see Interference/detection_log.py). Old detections move from
+# detections_log.json into gzip JSONL segments; `python manage.py archive_detections`
+# rotates, compacts and expires them by hand.
+CIVICX_LOG_SEGMENTS_DIR = os.path.join(BASE_DIR, "detections_archive")
+CIVICX_LOG_ROTATE_BYTES = 1024 * 1024
+CIVICX_LOG_ROTATE_DAYS = 1
+CIVICX_LOG_SEGMENT_TARGET_BYTES = 8 * 1024 * 1024
+CIVICX_LOG_SEGMENT_MAX_SPAN_S = 24 * 60 * 60
+CIVICX_LOG_COMPACT_INTERVAL_S = 300
+CIVICX_LOG_RETENTION_DAYS = None
+
+# Server camera (see Interference/camera.py). CIVICX_CAMERA_SOURCE may also be a video
+# file path, which is looped at its own frame rate in place of a real device.
+CIVICX_CAMERA_SOURCE = 0
+CIVICX_CAMERA_IDLE_RELEASE_S = 30.0
+CIVICX_CAMERA_MAX_FRAME_AGE_S = 1.0
+
+# Bearer token for POST /Interference/models/load/ and /models/rollback/; unset disables them
+CIVICX_MODEL_ADMIN_TOKEN = os.environ.get("CIVICX_MODEL_ADMIN_TOKEN")
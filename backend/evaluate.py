@@ -0,0 +1,246 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RUNS_DIR = os.path.join(BASE_DIR, "runs", "classify")
+DATA_DIR = "E:/java-chat-app/CivicX/backend/yolo_classification_dataset"
+VAL_DIRS = ("val", "valid", "validation", "test")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+# Exported formats ultralytics can load for classification
+EXPORT_PATTERNS = ("*.pt", "*.onnx", "*.torchscript", "*_openvino_model", "*_ncnn_model")
+
+
+# ---------------------- DISCOVERY ----------------------
+def find_models(runs_dir, variants):
+    """Return [(name, weights path)] for every run, best.pt first."""
+    found = []
+    for run_dir in sorted(glob.glob(os.path.join(runs_dir, "*"))):
+        weights_dir = os.path.join(run_dir, "weights")
+        if not os.path.isdir(weights_dir):
+            continue
+        run = os.path.basename(run_dir)
+        if not variants:
+            best = os.path.join(weights_dir, "best.pt")
+            if os.path.exists(best):
+                found.append((run, best))
+            continue
+        for pattern in EXPORT_PATTERNS:
+            for path in sorted(glob.glob(os.path.join(weights_dir, pattern))):
+                if os.path.basename(path) == "last.pt":
+                    continue
+                found.append((f"{run}/{os.path.basename(path)}", path))
+    return found
+
+
+def load_validation(data_dir, load_size, limit=None):
+    """Load the validation split into memory (BGR, short side capped at ``load_size``)."""
+    val_dir = next((os.path.join(data_dir, d) for d in VAL_DIRS if os.path.isdir(os.path.join(data_dir, d))), None)
+    if val_dir is None:
+        raise SystemExit(f"No validation split ({'/'.join(VAL_DIRS)}) in {data_dir}")
+    classes = sorted(e.name for e in os.scandir(os.path.join(data_dir, "train")) if e.is_dir())
+
+    images, labels = [], []
+    for label, c in enumerate(classes):
+        class_dir = os.path.join(val_dir, c)
+        if not os.path.isdir(class_dir):
+            continue
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTS))
+        for f in files[:limit]:
+            img = cv2.imread(os.path.join(class_dir, f), cv2.IMREAD_COLOR)
+            if img is None:
+                print(f"[WARNING] Could not decode {f}")
+                continue
+            h, w = img.shape[:2]
+            scale = load_size / min(h, w)
+            if scale < 1:
+                img = cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+            images.append(img)
+            labels.append(label)
+    print(f"Loaded {len(images)} validation images from {val_dir}")
+    return classes, images, np.array(labels, dtype=np.int64)
+
+
+# ---------------------- SCORING ----------------------
+def _probs(results):
+    out = []
+    for r in results:
+        data = r.probs.data
+        out.append(data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data))
+    return np.stack(out).astype(np.float32)
+
+
+def predict_all(model, images, batch, device="cpu"):
+    """Class probabilities for every image, shape (N, model classes)."""
+    chunks = []
+    for i in range(0, len(images), batch):
+        chunks.append(_probs(model(images[i:i + batch], device=device, verbose=False)))
+    return np.concatenate(chunks)
+
+
+def dataset_index(model_names, n, classes):
+    """Model class index -> dataset class index (-1 if the model has no such class)."""
+    return np.array([classes.index(model_names[i]) if model_names[i] in classes else -1 for i in range(n)])
+
+
+def score(probs, labels, model_names, classes):
+    """Top-1/top-5 accuracy and a confusion matrix in dataset class order."""
+    to_dataset = dataset_index(model_names, probs.shape[1], classes)
+    order = np.argsort(-probs, axis=1)
+    top1 = to_dataset[order[:, 0]]
+    top5 = to_dataset[order[:, :5]]
+
+    n = len(classes)
+    confusion = np.zeros((n, n + 1), dtype=np.int64)  # last column: predicted a class outside the dataset
+    for true, pred in zip(labels, top1):
+        confusion[true, pred if pred >= 0 else n] += 1
+    return {
+        "top1": float(np.mean(top1 == labels)),
+        "top5": float(np.mean((top5 == labels[:, None]).any(axis=1))),
+        "confusion": confusion.tolist(),
+        "unmapped_classes": int(np.sum(to_dataset < 0)),
+    }
+
+
+def profile_latency(model, images, batch_sizes, threads, repeats, warmup=2, device="cpu"):
+    """Median per-image latency (ms) for each (threads, batch size).
+
+    Pinned to ``device`` (CPU by default): ultralytics would otherwise pick a GPU
+    when one is present, and the thread count only applies to the CPU.
+    """
+    import torch
+
+    results = {}
+    for n_threads in threads:
+        torch.set_num_threads(n_threads)
+        cv2.setNumThreads(n_threads)
+        for bs in batch_sizes:
+            batch = [images[i % len(images)] for i in range(bs)]
+            try:
+                for _ in range(warmup):
+                    model(batch, device=device, verbose=False)
+                times = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    model(batch, device=device, verbose=False)
+                    times.append((time.perf_counter() - start) / bs)
+                results[f"t{n_threads}_b{bs}"] = round(statistics.median(times) * 1000, 3)
+            except Exception as e:
+                # e.g. an ONNX export with a fixed batch dimension
+                print(f"  threads={n_threads} batch={bs}: {e}")
+                results[f"t{n_threads}_b{bs}"] = None
+    return results
+
+
+def simulate_cascade(small, large, labels, min_confidence, min_margin):
+    """Accuracy and escalation rate of the views.py cascade from stored probabilities."""
+    top2 = np.sort(small["probs"], axis=1)[:, -2:]
+    confident = (top2[:, 1] >= min_confidence) & ((top2[:, 1] - top2[:, 0]) >= min_margin)
+    pred = np.where(confident, small["top1_pred"], large["top1_pred"])
+    return {"escalation_rate": float(1 - confident.mean()), "top1": float(np.mean(pred == labels))}
+
+
+# ---------------------- REPORT ----------------------
+def print_confusion(confusion, classes):
+    corner = "true / pred"
+    width = max(len(corner), *(len(c) for c in classes))
+    print(f"  {corner:<{width}} " + " ".join(f"{i:>5}" for i in range(len(classes))) + "  other  recall")
+    for i, (c, row) in enumerate(zip(classes, confusion)):
+        total = sum(row)
+        recall = row[i] / total if total else 0.0
+        print(f"  {c:<{width}} " + " ".join(f"{v:>5}" for v in row[:-1]) + f"  {row[-1]:>5}  {recall:6.3f}")
+
+
+def print_table(rows, latency_keys):
+    header = f"{'model':<45} {'top1':>6} {'top5':>6} " + " ".join(f"{k:>10}" for k in latency_keys)
+    print("\n" + header)
+    print("-" * len(header))
+    for row in sorted(rows, key=lambda r: -r["top1"]):
+        cells = [row["latency_ms"].get(k) for k in latency_keys]
+        lat = " ".join(f"{'-' if v is None else v:>10}" for v in cells)
+        print(f"{row['model']:<45} {row['top1']:>6.3f} {row['top5']:>6.3f} {lat}")
+    print("(latency = median ms per image; tN_bM = N torch threads, batch M)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare runs/classify models on accuracy and CPU latency.")
+    parser.add_argument("--data", default=DATA_DIR, help="Dataset folder from prepare_dataset.py")
+    parser.add_argument("--runs", default=RUNS_DIR)
+    parser.add_argument("--models", nargs="*", help="Explicit weights to evaluate instead of scanning --runs")
+    parser.add_argument("--variants", action="store_true", help="Also evaluate exported ONNX/OpenVINO/... weights")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--device", default="cpu",
+                        help="Device for inference and latency profiling (e.g. cpu, 0); --threads only applies to cpu")
+    parser.add_argument("--limit", type=int, default=None, help="Max validation images per class")
+    parser.add_argument("--load-size", type=int, default=256, help="Cap on the short side of loaded images")
+    parser.add_argument("--cascade", nargs=2, metavar=("SMALL", "LARGE"),
+                        help="Also score a small->large cascade of two evaluated models (by table name)")
+    parser.add_argument("--min-confidence", type=float, default=0.80)
+    parser.add_argument("--min-margin", type=float, default=0.30)
+    parser.add_argument("--out", default=os.path.join(RUNS_DIR, "evaluation.json"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    models = [(p, p) for p in args.models] if args.models else find_models(args.runs, args.variants)
+    if not models:
+        raise SystemExit(f"No weights found under {args.runs}")
+
+    classes, images, labels = load_validation(args.data, args.load_size, args.limit)
+    if not images:
+        raise SystemExit("Validation split is empty")
+
+    rows, stored = [], {}
+    for name, path in models:
+        print(f"\nEvaluating {name} ({path})")
+        model = YOLO(path, task="classify")
+        try:
+            probs = predict_all(model, images, max(args.batch_sizes), args.device)
+        except Exception:
+            probs = predict_all(model, images, 1, args.device)  # fixed-batch exports
+        scores = score(probs, labels, model.names, classes)
+        latency = profile_latency(model, images, args.batch_sizes, args.threads, args.repeats,
+                                  device=args.device)
+        rows.append(dict(model=name, path=path, latency_ms=latency, **scores))
+        to_dataset = dataset_index(model.names, probs.shape[1], classes)
+        stored[name] = {"probs": probs, "top1_pred": to_dataset[probs.argmax(axis=1)]}
+        print(f"  top1={scores['top1']:.3f} top5={scores['top5']:.3f} latency={latency}")
+        print_confusion(scores["confusion"], classes)
+
+    latency_keys = [f"t{t}_b{b}" for t in args.threads for b in args.batch_sizes]
+    print_table(rows, latency_keys)
+
+    report = {"classes": classes, "images": len(images), "device": args.device, "models": rows}
+    if args.cascade:
+        small, large = args.cascade
+        if small not in stored or large not in stored:
+            print(f"[WARNING] Cascade models must be among: {list(stored)}")
+        else:
+            cascade = simulate_cascade(stored[small], stored[large], labels, args.min_confidence, args.min_margin)
+            rows_by_name = {r["model"]: r for r in rows}
+            key = f"t{args.threads[0]}_b1"
+            small_ms, large_ms = rows_by_name[small]["latency_ms"].get(key), rows_by_name[large]["latency_ms"].get(key)
+            if small_ms is not None and large_ms is not None:
+                cascade["expected_latency_ms"] = round(small_ms + cascade["escalation_rate"] * large_ms, 3)
+            report["cascade"] = dict(small=small, large=large, min_confidence=args.min_confidence,
+                                     min_margin=args.min_margin, **cascade)
+            print(f"\nCascade {small} -> {large}: {report['cascade']}")
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nReport (with confusion matrices) written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
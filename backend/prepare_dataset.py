@@ -1,6 +1,9 @@
+import argparse
+import hashlib
+import json
 import os
 import shutil
-import random
+from concurrent.futures import ThreadPoolExecutor
 
 SOURCE_DIR = r"E:/java-chat-app/CivicX/backend/archive (2)"
 TARGET_DIR = r"E:/java-chat-app/CivicX/backend/yolo_classification_dataset"
@@ -17,54 +20,229 @@ CLASSES = [
     "Potholes and RoadCracks"
 ]
 
-os.makedirs(TARGET_DIR + "/train", exist_ok=True)
-os.makedirs(TARGET_DIR + "/valid", exist_ok=True)
+IMAGE_EXTS = (".jpg", ".png", ".jpeg")
+SPLITS = ("train", "valid")
+# Per-file hashes keyed by (path, size, mtime) so unchanged sources are not re-read
+HASH_CACHE_NAME = ".hash_cache.json"
+MANIFEST_NAME = "manifest.json"
+
 
 def collect_images(root):
     imgs = []
     for path, _, files in os.walk(root):
         for f in files:
-            if f.lower().endswith((".jpg", ".png", ".jpeg")):
+            if f.lower().endswith(IMAGE_EXTS):
                 full_path = os.path.join(path, f)
                 if os.path.isfile(full_path):  # check if exists
                     imgs.append(full_path)
                 else:
                     print(f"[WARNING] Missing file skipped: {full_path}")
-    return imgs
+    return sorted(imgs)
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def hash_images(paths, cache, workers):
+    """Return {path: sha1}, reusing cached hashes for files whose size/mtime match."""
+    def one(path):
+        st = os.stat(path)
+        key = f"{st.st_size}:{st.st_mtime_ns}"
+        cached = cache.get(path)
+        if cached and cached[0] == key:
+            return path, key, cached[1]
+        return path, key, file_sha1(path)
+
+    hashes = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, key, digest in pool.map(one, paths):
+            cache[path] = [key, digest]
+            hashes[path] = digest
+    return hashes
 
-for c in CLASSES:
-    print(f"\nProcessing class: {c}")
 
-    src = os.path.join(SOURCE_DIR, c)
-    if not os.path.exists(src):
-        print(f"[ERROR] Folder not found: {src}")
-        continue
+def _split_score(seed, digest):
+    """Uniform value in [0, 1) fixed by the seed and the file's own content hash."""
+    return int(hashlib.sha1(f"{seed}:{digest}".encode()).hexdigest()[:8], 16) / 2 ** 32
 
-    images = collect_images(src)
 
-    if len(images) == 0:
-        print(f"[WARNING] No images found for {c}. Skipping.")
-        continue
+def split_class(digests, valid_ratio, seed):
+    """Per-file split: each image's side depends only on its hash and the seed.
 
-    random.shuffle(images)
-    split = int(len(images) * 0.8)
+    Adding or removing images never moves the others between train and valid.
+    A class with several images but none scoring under ``valid_ratio`` still
+    gets its lowest-scoring image as validation.
+    """
+    scored = sorted((_split_score(seed, d), d) for d in digests)
+    valid = [d for score, d in scored if score < valid_ratio]
+    if not valid and valid_ratio > 0 and len(scored) > 1:
+        valid = [scored[0][1]]
+    valid_set = set(valid)
+    train = [d for _, d in scored if d not in valid_set]
+    return train, valid
 
-    train_imgs = images[:split]
-    valid_imgs = images[split:]
 
-    os.makedirs(f"{TARGET_DIR}/train/{c}", exist_ok=True)
-    os.makedirs(f"{TARGET_DIR}/valid/{c}", exist_ok=True)
+def materialize(src, dst, mode, imgsz):
+    """Copy, hardlink or resize ``src`` to ``dst``; skip if ``dst`` is already there."""
+    if os.path.exists(dst):
+        return "skipped"
+    tmp = dst + ".tmp"
+    if imgsz:
+        import cv2
 
-    for img in train_imgs:
+        img = cv2.imread(src, cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("could not decode image")
+        h, w = img.shape[:2]
+        scale = imgsz / min(h, w)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                             interpolation=cv2.INTER_AREA)
+        if not cv2.imwrite(tmp + ".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 95]):
+            raise OSError("could not write resized image")
+        os.replace(tmp + ".jpg", dst)
+        return "resized"
+    if mode == "hardlink":
         try:
-            shutil.copy(img, f"{TARGET_DIR}/train/{c}")
-        except Exception as e:
-            print(f"[ERROR copying] {img} -> {e}")
+            os.link(src, dst)
+            return "linked"
+        except OSError:
+            pass  # cross-device or unsupported; fall back to a copy
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    return "copied"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the YOLO classification dataset (train/valid folders per class).")
+    parser.add_argument("--source", default=SOURCE_DIR, help="Folder with one sub-folder of images per class")
+    parser.add_argument("--target", default=TARGET_DIR, help="Output dataset folder")
+    parser.add_argument("--classes", nargs="+", default=CLASSES, help="Class folder names to include")
+    parser.add_argument("--valid-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 4))
+    parser.add_argument("--mode", choices=("copy", "hardlink"), default="hardlink",
+                        help="How to place originals in the target (ignored with --imgsz)")
+    parser.add_argument("--imgsz", type=int, default=0,
+                        help="Pre-resize so the short side is at most this many pixels (e.g. 224); 0 keeps originals")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.target, exist_ok=True)
+
+    cache_path = os.path.join(args.target, HASH_CACHE_NAME)
+    cache = load_json(cache_path)
+
+    plan = {}          # dst path -> src path
+    manifest = {"source": args.source, "seed": args.seed, "valid_ratio": args.valid_ratio,
+                "imgsz": args.imgsz, "classes": {}}
+    seen = {}          # digest -> class it was first assigned to
 
-    for img in valid_imgs:
+    for c in args.classes:
+        print(f"\nProcessing class: {c}")
+
+        src = os.path.join(args.source, c)
+        if not os.path.exists(src):
+            print(f"[ERROR] Folder not found: {src}")
+            continue
+
+        images = collect_images(src)
+
+        if len(images) == 0:
+            print(f"[WARNING] No images found for {c}. Skipping.")
+            continue
+
+        hashes = hash_images(images, cache, args.workers)
+
+        # Content-hash dedupe: identical files keep one copy, and never land in both splits
+        by_digest = {}
+        cross_class = 0
+        for path in images:
+            digest = hashes[path]
+            if digest in seen and seen[digest] != c:
+                cross_class += 1
+                continue
+            seen[digest] = c
+            by_digest.setdefault(digest, path)
+        duplicates = len(images) - len(by_digest) - cross_class
+        if cross_class:
+            print(f"[WARNING] {cross_class} images in {c} also appear under another class; kept the first.")
+
+        train, valid = split_class(list(by_digest), args.valid_ratio, args.seed)
+        for split, digests in (("train", train), ("valid", valid)):
+            os.makedirs(os.path.join(args.target, split, c), exist_ok=True)
+            for digest in digests:
+                src_path = by_digest[digest]
+                ext = ".jpg" if args.imgsz else os.path.splitext(src_path)[1].lower()
+                plan[os.path.join(args.target, split, c, digest[:16] + ext)] = src_path
+
+        manifest["classes"][c] = {"train": len(train), "valid": len(valid),
+                                  "duplicates": duplicates, "cross_class": cross_class}
+
+    # Drop outputs that are no longer part of the plan (changed split or sources);
+    # a different --imgsz invalidates everything already in place. Only classes
+    # built in this run are touched: a --classes subset or a missing source folder
+    # leaves the other classes' output alone.
+    previous = load_json(os.path.join(args.target, MANIFEST_NAME))
+    rebuild = bool(previous) and previous.get("imgsz") != args.imgsz
+    kept = {c: counts for c, counts in previous.get("classes", {}).items() if c not in manifest["classes"]}
+    if kept and rebuild:
+        print(f"[WARNING] --imgsz changed; output for {sorted(kept)} was not rebuilt (not part of this run).")
+    elif kept:
+        manifest["classes"].update(kept)
+    removed = 0
+    for split in SPLITS:
+        for c in manifest["classes"]:
+            class_dir = os.path.join(args.target, split, c)
+            if c in kept or not os.path.isdir(class_dir):
+                continue
+            for f in os.listdir(class_dir):
+                path = os.path.join(class_dir, f)
+                if rebuild or path not in plan:
+                    os.remove(path)
+                    removed += 1
+
+    def place(item):
+        dst, src = item
         try:
-            shutil.copy(img, f"{TARGET_DIR}/valid/{c}")
+            return materialize(src, dst, args.mode, args.imgsz)
         except Exception as e:
-            print(f"[ERROR copying] {img} -> {e}")
+            print(f"[ERROR copying] {src} -> {e}")
+            return "failed"
+
+    outcome = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for result in pool.map(place, plan.items()):
+            outcome[result] = outcome.get(result, 0) + 1
+
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    manifest["files"] = dict(outcome, removed=removed)
+    with open(os.path.join(args.target, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+
+    print(f"\n{'class':<30} {'train':>7} {'valid':>7} {'dupes':>7}")
+    for c, counts in manifest["classes"].items():
+        print(f"{c:<30} {counts['train']:>7} {counts['valid']:>7} {counts['duplicates'] + counts['cross_class']:>7}")
+    print(f"files: {manifest['files']}")
+
+    print("\n🎉 Dataset conversion completed successfully!")
+
 
-print("\n🎉 Dataset conversion completed successfully!")
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,212 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
 from ultralytics import YOLO
+from ultralytics.models.yolo.classify import ClassificationTrainer
+
+DATA_DIR = "E:/java-chat-app/CivicX/backend/yolo_classification_dataset"
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+VAL_DIRS = ("val", "valid", "validation", "test")
+
+
+# ---------------------- MEMORY-MAPPED DATASET CACHE ----------------------
+# Each split is decoded and resized once into <cache>/<split>_images.npy, a
+# (N, S, S, 3) uint8 RGB array opened with mmap, plus <split>_labels.npy and
+# index.json. Loader workers then only slice the array instead of decoding JPEGs.
+
+def _list_split(split_dir, classes):
+    samples = []
+    for label, c in enumerate(classes):
+        class_dir = os.path.join(split_dir, c)
+        if not os.path.isdir(class_dir):
+            continue
+        for f in sorted(os.listdir(class_dir)):
+            if f.lower().endswith(IMAGE_EXTS):
+                samples.append((os.path.join(class_dir, f), label))
+    return samples
+
+
+def _fingerprint(samples, size):
+    h = hashlib.sha1(str(size).encode())
+    for path, label in samples:
+        st = os.stat(path)
+        h.update(f"{path}|{label}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def _load_square(path, size):
+    """Resize the short side to ``size`` and center-crop, like classify_transforms."""
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    scale = size / min(h, w)
+    img = cv2.resize(img, (max(size, round(w * scale)), max(size, round(h * scale))),
+                     interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    h, w = img.shape[:2]
+    top, left = (h - size) // 2, (w - size) // 2
+    return cv2.cvtColor(img[top:top + size, left:left + size], cv2.COLOR_BGR2RGB)
+
+
+def build_cache(data_dir, cache_dir, size, workers):
+    """Build (or reuse) the mmap cache; returns the index dict."""
+    os.makedirs(cache_dir, exist_ok=True)
+    train_dir = os.path.join(data_dir, "train")
+    classes = sorted(e.name for e in os.scandir(train_dir) if e.is_dir())
+    val_dir = next((os.path.join(data_dir, d) for d in VAL_DIRS if os.path.isdir(os.path.join(data_dir, d))), None)
+
+    index_path = os.path.join(cache_dir, "index.json")
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            old_index = json.load(f)
+    except (OSError, ValueError):
+        old_index = {}
+
+    index = {"data": data_dir, "size": size, "classes": classes, "splits": {}}
+    for split, split_dir in (("train", train_dir), ("val", val_dir)):
+        if split_dir is None:
+            continue
+        samples = _list_split(split_dir, classes)
+        fingerprint = _fingerprint(samples, size)
+        images_path = os.path.join(cache_dir, f"{split}_images.npy")
+        labels_path = os.path.join(cache_dir, f"{split}_labels.npy")
+
+        old = old_index.get("splits", {}).get(split)
+        if old and old.get("fingerprint") == fingerprint and os.path.exists(images_path):
+            print(f"{split}: reusing cache ({old['count']} images)")
+            index["splits"][split] = old
+            continue
+
+        print(f"{split}: caching {len(samples)} images at {size}x{size} ...")
+        images = np.lib.format.open_memmap(images_path, mode="w+", dtype=np.uint8,
+                                           shape=(len(samples), size, size, 3))
+        labels = np.array([label for _, label in samples], dtype=np.int64)
+        ok = np.ones(len(samples), dtype=bool)
+
+        def fill(i, out):
+            img = _load_square(samples[i][0], size)
+            if img is None:
+                print(f"[WARNING] Could not decode {samples[i][0]}")
+                ok[i] = False
+            else:
+                out[i] = img
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fill, range(len(samples)), [images] * len(samples)))
+        images.flush()
+        del images
+        np.save(labels_path, labels)
+        np.save(os.path.join(cache_dir, f"{split}_valid.npy"), np.flatnonzero(ok))
+        index["splits"][split] = {"count": len(samples), "fingerprint": fingerprint}
+
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=4)
+    return index
+
+
+class MmapClassificationDataset:
+    """Classification dataset served from the memory-mapped cache.
+
+    The array is opened lazily so each loader worker maps the file itself rather
+    than receiving a pickled copy.
+    """
+
+    def __init__(self, cache_dir, split, args, augment=False):
+        from ultralytics.data.augment import classify_augmentations, classify_transforms
+
+        self.images_path = os.path.join(cache_dir, f"{split}_images.npy")
+        self.labels = np.load(os.path.join(cache_dir, f"{split}_labels.npy"))
+        self.keep = np.load(os.path.join(cache_dir, f"{split}_valid.npy"))
+        self._images = None
+        if augment:
+            scale = (1.0 - args.scale, 1.0)
+            self.torch_transforms = classify_augmentations(
+                size=args.imgsz, scale=scale, hflip=args.fliplr, vflip=args.flipud,
+                erasing=args.erasing, auto_augment=args.auto_augment,
+                hsv_h=args.hsv_h, hsv_s=args.hsv_s, hsv_v=args.hsv_v,
+            )
+        else:
+            self.torch_transforms = classify_transforms(size=args.imgsz)
+
+    def __len__(self):
+        return len(self.keep)
+
+    def __getitem__(self, i):
+        from PIL import Image
+
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode="r")
+        j = int(self.keep[i])
+        sample = self.torch_transforms(Image.fromarray(np.asarray(self._images[j])))
+        return {"img": sample, "cls": int(self.labels[j])}
+
+
+class MmapClassificationTrainer(ClassificationTrainer):
+    """ClassificationTrainer that reads batches from the mmap cache in ``cache_dir``."""
+
+    cache_dir = None
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        split = "train" if mode == "train" else "val"
+        return MmapClassificationDataset(self.cache_dir, split, self.args, augment=mode == "train")
+
+
+def detect_device():
+    import torch
+
+    if torch.cuda.is_available():
+        return "0"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the CivicX issue classifier.")
+    parser.add_argument("--data", default=DATA_DIR, help="Dataset folder from prepare_dataset.py")
+    parser.add_argument("--model", default="yolov8m-cls.pt", help="Base weights (e.g. yolov8n-cls.pt for the cascade's small model)")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--imgsz", type=int, default=224)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--device", default="auto", help="auto, cpu, mps or a CUDA index")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument("--name", default="civicx_cls_model")
+    parser.add_argument("--cache", choices=("auto", "mmap", "none"), default="auto",
+                        help="mmap: train from a pre-resized memory-mapped cache (auto = on CPU only)")
+    parser.add_argument("--cache-dir", default=None, help="Defaults to <data>/.mmap_cache_<imgsz>")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    device = detect_device() if args.device == "auto" else args.device
+    use_cache = args.cache == "mmap" or (args.cache == "auto" and device == "cpu")
+    print(f"Training on device={device} with {args.workers} workers (mmap cache: {'on' if use_cache else 'off'})")
+
+    train_kwargs = {}
+    if use_cache:
+        cache_dir = args.cache_dir or os.path.join(args.data, f".mmap_cache_{args.imgsz}")
+        build_cache(args.data, cache_dir, args.imgsz, args.workers)
+        MmapClassificationTrainer.cache_dir = cache_dir
+        train_kwargs["trainer"] = MmapClassificationTrainer
 
-def main():
-    model = YOLO("yolov8m-cls.pt")
+    model = YOLO(args.model)
 
     model.train(
-        data="E:/java-chat-app/CivicX/backend/yolo_classification_dataset",
-        epochs=50,
-        imgsz=224,
-        batch=16,
-        device=0,
-        name="civicx_cls_model",
-        workers=0,    # IMPORTANT FOR WINDOWS
+        data=args.data,
+        epochs=args.epochs,
+        imgsz=args.imgsz,
+        batch=args.batch,
+        device=device,
+        name=args.name,
+        workers=args.workers,
+        **train_kwargs,
     )
 
 if __name__ == "__main__":
     main()
-  
\ No newline at end of file